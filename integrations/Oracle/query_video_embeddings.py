@@ -1,6 +1,13 @@
 import os
 import sys
 import array
+import time
+import random
+import functools
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import oracledb
 from twelvelabs import TwelveLabs
 from twelvelabs.models.embed import EmbeddingsTask
@@ -24,41 +31,163 @@ if not twelvelabs_client.api_key:
 EMBEDDING_MODEL = "Marengo-retrieval-2.7"
 SEGMENT_DURATION = 6  # seconds per segment
 TOP_K = 5  # number of results to return in similarity search
+EMBED_MAX_WORKERS = 8  # concurrent embed requests in similarity_search_multiple
+EMBED_SUBMIT_JITTER = 0.05  # max seconds of random delay between embed submissions in a batch
+QUERY_CACHE_SIZE = 2048  # number of query embeddings kept in memory
+EMBEDDING_DIM = 1024  # Marengo embedding dimension
+SEMANTIC_CACHE_SIZE = 1024  # number of query results kept for near-duplicate reuse
+SEMANTIC_CACHE_THRESHOLD = 0.95  # min cosine similarity for a query to reuse cached results
+SEARCH_TARGET_ACCURACY = 95  # percent recall requested from the approximate (index) search
+# HNSW efSearch (candidates explored per search) for indexes built with --index-type hnsw;
+# when set it replaces SEARCH_TARGET_ACCURACY, 0 keeps the percent target
+EF_SEARCH = int(os.getenv("ORACLE_VECTOR_EF_SEARCH", "0"))
+SEARCH_MAX_WORKERS = 8  # concurrent database searches in similarity_search_multiple
+POOL_MIN = 2  # connections opened when the pool is created
+POOL_MAX = 16  # upper bound on concurrent database sessions
+STMT_CACHE_SIZE = 40  # parsed statements cached per pooled connection
 
+# Top-k similarity search query. FETCH APPROXIMATE lets the optimizer use the vector
+# index (an exact FETCH FIRST forces a full scan) and the hint keeps it from falling
+# back to a brute-force plan when statistics are stale. Oracle has no session setting
+# for efSearch; it is passed per query in the target accuracy clause
+SEARCH_ACCURACY = (f"PARAMETERS (EFSEARCH {EF_SEARCH})" if EF_SEARCH > 0
+                   else str(SEARCH_TARGET_ACCURACY))
+SEARCH_SQL = f"""
+SELECT /*+ VECTOR_INDEX_SCAN(ve video_embeddings_idx) */ video_file, start_time, end_time
+FROM video_embeddings ve
+ORDER BY vector_distance(embedding_vector, :1, COSINE)
+FETCH APPROXIMATE FIRST :2 ROWS ONLY WITH TARGET ACCURACY {SEARCH_ACCURACY}
+"""
+
+# Oracle connection pool shared by all calls, created on first use by get_pool()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class SemanticResultCache:
+    """Reuse the top-k results of a previous query whose embedding is nearly identical"""
+
+    def __init__(self, max_entries=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.threshold = threshold
+        # Unit-normalized query vectors in a fixed-size ring buffer, so cosine similarity
+        # against every cached query is a single matrix-vector product
+        self._vectors = np.zeros((max_entries, EMBEDDING_DIM), dtype=np.float32)
+        self._results = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(query_vector):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def lookup(self, query_vector):
+        """Return cached results for a similar query, or None on a miss"""
+        vector = self._normalize(query_vector)
+        with self._lock:
+            if not self._size:
+                return None
+            scores = self._vectors[:self._size] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._results[best]
+        return None
+
+    def add(self, query_vector, results):
+        """Cache results for a query, evicting the oldest entry when full"""
+        vector = self._normalize(query_vector)
+        with self._lock:
+            self._vectors[self._next] = vector
+            self._results[self._next] = results
+            self._next = (self._next + 1) % len(self._results)
+            self._size = min(self._size + 1, len(self._results))
+
+
+semantic_cache = SemanticResultCache()
+
+
+def get_pool():
+    """Return the shared Oracle connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool = oracledb.create_pool(
+                user=db_username,
+                password=db_password,
+                dsn=db_connect_string,
+                config_dir=db_wallet_path,
+                wallet_location=db_wallet_path,
+                wallet_password=db_password,
+                min=POOL_MIN,
+                max=POOL_MAX,
+                increment=1,
+                stmtcachesize=STMT_CACHE_SIZE
+            )
+            pool.ping_interval = 60
+            
+            # Verify DB version
+            with pool.acquire() as connection:
+                db_version = tuple(int(s) for s in connection.version.split("."))[:2]
+            if db_version < (23, 7):
+                sys.exit("This example requires Oracle Database 23.7 or later")
+            print("Connected to Oracle Database")
+            _pool = pool
+    return _pool
+
+@contextlib.contextmanager
+def read_only_transaction(connection):
+    """Run the enclosed queries in a read-only transaction, which skips undo/redo bookkeeping"""
+    with connection.cursor() as cursor:
+        cursor.execute("SET TRANSACTION READ ONLY")
+    try:
+        yield connection
+    finally:
+        # End the transaction so the pooled session is released clean
+        connection.rollback()
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_query(query_text):
+    """Create a text embedding for a single query (cached, embeddings are deterministic per model)"""
+    embedding = twelvelabs_client.embed.create(
+        model_name=EMBEDDING_MODEL,
+        text=query_text,
+        text_truncate="start",
+    )
+    
+    if len(embedding.text_embedding.segments) > 1:
+        print(f"Warning: Query '{query_text}' generated {len(embedding.text_embedding.segments)} segments. Using only the first segment.")
+    
+    # Normalize and quantize like the stored vectors so the bind type matches the int8 column;
+    # cosine distance is unaffected by the per-vector scale
+    vector = np.asarray(embedding.text_embedding.segments[0].embeddings_float, dtype=np.float32)
+    vector /= np.linalg.norm(vector) + 1e-12
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return array.array("b", np.round(vector / scale).astype(np.int8).tobytes())
+
+def _rows_to_results(rows):
+    """Convert (video_file, start_time, end_time) rows into result dicts"""
+    return [
+        {'video_file': video_file, 'start_time': start_time, 'end_time': end_time}
+        for video_file, start_time, end_time in rows
+    ]
 
 def similarity_search(connection, query_text):
     """Perform similarity search using query text"""
     try:
-        # Create embedding for query
-        embedding = twelvelabs_client.embed.create(
-            model_name=EMBEDDING_MODEL,
-            text=query_text,
-            text_truncate="start",
-        )
+        query_vector = _embed_query(query_text)
         
-        if len(embedding.text_embedding.segments) > 1:
-            print(f"Warning: Query generated {len(embedding.text_embedding.segments)} segments. Using only the first segment.")
+        cached_results = semantic_cache.lookup(query_vector)
+        if cached_results is not None:
+            return cached_results
         
-        query_vector = array.array("d", embedding.text_embedding.segments[0].embeddings_float)
-        
-        # Search query
-        search_sql = """
-        SELECT video_file, start_time, end_time
-        FROM video_embeddings
-        ORDER BY vector_distance(embedding_vector, :1, COSINE)
-        FETCH FIRST :2 ROWS ONLY
-        """
-        
-        results = []
-        cursor = connection.cursor()
-        cursor.execute(search_sql, [query_vector, TOP_K])
-        for row in cursor:
-            results.append({
-                'video_file': row[0],
-                'start_time': row[1],
-                'end_time': row[2]
-            })
-        cursor.close()
+        with connection.cursor() as cursor:
+            # Return all top-k rows with the execute round-trip itself
+            cursor.prefetchrows = TOP_K + 1
+            cursor.arraysize = TOP_K
+            cursor.execute(SEARCH_SQL, [query_vector, TOP_K])
+            results = _rows_to_results(cursor.fetchall())
+        semantic_cache.add(query_vector, results)
         return results
         
     except oracledb.DatabaseError as e:
@@ -69,7 +198,21 @@ def similarity_search(connection, query_text):
         print(f"An error occurred: {str(e)}")
         raise
 
-def similarity_search_multiple(connection, query_texts, batch_size=1000):
+def _search_vectors(query_vectors):
+    """Run top-k searches for several query vectors on one pooled connection and prepared cursor"""
+    with get_pool().acquire() as connection, read_only_transaction(connection), connection.cursor() as cursor:
+        # Parse the statement once; each execute(None, ...) reuses it
+        cursor.prepare(SEARCH_SQL)
+        # Return all top-k rows with the execute round-trip itself
+        cursor.prefetchrows = TOP_K + 1
+        cursor.arraysize = TOP_K
+        results = []
+        for query_vector in query_vectors:
+            cursor.execute(None, [query_vector, TOP_K])
+            results.append(_rows_to_results(cursor.fetchall()))
+        return results
+
+def similarity_search_multiple(query_texts, batch_size=1000):
     """Perform multiple similarity searches using a list of query texts in batches"""
     results_by_query = {}
     
@@ -78,108 +221,64 @@ def similarity_search_multiple(connection, query_texts, batch_size=1000):
         batch_queries = query_texts[i:i + batch_size]
         print(f"\nProcessing batch {i//batch_size + 1} ({len(batch_queries)} queries)")
         
-        # Create embeddings for batch queries
-        embeddings = []
-        for query_text in batch_queries:
-            embedding = twelvelabs_client.embed.create(
-                model_name=EMBEDDING_MODEL,
-                text=query_text,
-                text_truncate="start",
-            )
-            
-            if len(embedding.text_embedding.segments) > 1:
-                print(f"Warning: Query '{query_text}' generated {len(embedding.text_embedding.segments)} segments. Using only the first segment.")
-            
-            query_vector = array.array("d", embedding.text_embedding.segments[0].embeddings_float)
-            embeddings.append(query_vector)
+        # Create embeddings for batch queries concurrently, in input order. A random delay
+        # between submissions spreads the requests out and avoids bursts (HTTP 429)
+        with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as executor:
+            futures = []
+            for query_text in batch_queries:
+                if futures:
+                    time.sleep(random.uniform(0, EMBED_SUBMIT_JITTER))
+                futures.append(executor.submit(_embed_query, query_text))
+            embeddings = [future.result() for future in futures]
         
-        # Search query
-        search_sql = """
-        SELECT video_file, start_time, end_time
-        FROM video_embeddings
-        ORDER BY vector_distance(embedding_vector, :1, COSINE)
-        FETCH FIRST :2 ROWS ONLY
-        """
+        # Search the database concurrently for queries not answered by the cache.
+        # Misses are dealt round-robin to the workers, each running its share
+        # on its own pooled connection with a single prepared statement
+        batch_results = [semantic_cache.lookup(query_vector) for query_vector in embeddings]
+        misses = [j for j, results in enumerate(batch_results) if results is None]
+        worker_misses = [misses[w::SEARCH_MAX_WORKERS] for w in range(SEARCH_MAX_WORKERS)]
+        worker_misses = [indexes for indexes in worker_misses if indexes]
+        with ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS) as executor:
+            searches = executor.map(
+                _search_vectors,
+                [[embeddings[j] for j in indexes] for indexes in worker_misses]
+            )
+            for indexes, worker_results in zip(worker_misses, searches):
+                for j, results in zip(indexes, worker_results):
+                    semantic_cache.add(embeddings[j], results)
+                    batch_results[j] = results
         
-        with connection.cursor() as cursor:
-            for query_text, query_vector in zip(batch_queries, embeddings):
-                results = []
-                for row in cursor.execute(search_sql, [query_vector, TOP_K]):
-                    results.append({
-                        'video_file': row[0],
-                        'start_time': row[1],
-                        'end_time': row[2]
-                    })
-                results_by_query[query_text] = results
+        results_by_query.update(zip(batch_queries, batch_results))
     
     return results_by_query
 
 def query_video_embeddings(query_text):
     """Query video embeddings database with the given text"""
-    try:
-        connection = oracledb.connect(
-            user=db_username,
-            password=db_password,
-            dsn=db_connect_string,
-            config_dir=db_wallet_path,
-            wallet_location=db_wallet_path,
-            wallet_password=db_password
-        )
-        
-        # Verify DB version
-        db_version = tuple(int(s) for s in connection.version.split("."))[:2]
-        if db_version < (23, 7):
-            sys.exit("This example requires Oracle Database 23.7 or later")
-        print("Connected to Oracle Database")
-        
+    with get_pool().acquire() as connection, read_only_transaction(connection):
         print("\nSearching for relevant video segments...")
         results = similarity_search(connection, query_text)
-        
-        print("\nResults:")
-        print("========")
-        for r in results:
-            print(f"Video: {r['video_file']}")
-            print(f"Segment: {r['start_time']:.1f}s to {r['end_time']:.1f}s\n")
-                
-    finally:
-        if 'connection' in locals():
-            connection.close()
+    
+    print("\nResults:")
+    print("========")
+    for r in results:
+        print(f"Video: {r['video_file']}")
+        print(f"Segment: {r['start_time']:.1f}s to {r['end_time']:.1f}s\n")
     
     return results
 
 def query_video_embeddings_multiple(query_texts):
     """Query video embeddings database with multiple text queries"""
-    try:
-        connection = oracledb.connect(
-            user=db_username,
-            password=db_password,
-            dsn=db_connect_string,
-            config_dir=db_wallet_path,
-            wallet_location=db_wallet_path,
-            wallet_password=db_password
-        )
-        
-        # Verify DB version
-        db_version = tuple(int(s) for s in connection.version.split("."))[:2]
-        if db_version < (23, 7):
-            sys.exit("This example requires Oracle Database 23.7 or later")
-        print("Connected to Oracle Database")
-        
-        print("\nSearching for relevant video segments...")
-        results_by_query = similarity_search_multiple(connection, query_texts)
-        
-        print("\nResults:")
-        print("========")
-        for query_text, results in results_by_query.items():
-            print(f"\nQuery: '{query_text}'")
-            print("-" * (len(query_text) + 9))
-            for r in results:
-                print(f"Video: {r['video_file']}")
-                print(f"Segment: {r['start_time']:.1f}s to {r['end_time']:.1f}s\n")
-                
-    finally:
-        if 'connection' in locals():
-            connection.close()
+    print("\nSearching for relevant video segments...")
+    results_by_query = similarity_search_multiple(query_texts)
+    
+    print("\nResults:")
+    print("========")
+    for query_text, results in results_by_query.items():
+        print(f"\nQuery: '{query_text}'")
+        print("-" * (len(query_text) + 9))
+        for r in results:
+            print(f"Video: {r['video_file']}")
+            print(f"Segment: {r['start_time']:.1f}s to {r['end_time']:.1f}s\n")
     
     return results_by_query
 
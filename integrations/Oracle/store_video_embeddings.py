@@ -2,6 +2,12 @@ import os
 import sys
 import array
 import time
+import random
+import threading
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import oracledb
 from twelvelabs import TwelveLabs
 from twelvelabs.models.embed import EmbeddingsTask
@@ -15,6 +21,7 @@ db_password = os.getenv("ORACLE_DB_PASSWORD")
 db_connect_string = os.getenv("ORACLE_DB_CONNECT_STRING")
 db_wallet_path = os.getenv("ORACLE_DB_WALLET_PATH")
 twelvelabs_api_key = os.getenv("TWELVE_LABS_API_KEY")
+oracle_client_lib_dir = os.getenv("ORACLE_CLIENT_LIB_DIR")  # optional, enables thick mode
 
 # Initialize Twelve Labs client
 twelvelabs_client = TwelveLabs(api_key=twelvelabs_api_key)
@@ -28,7 +35,88 @@ if not twelvelabs_client.api_key:
 EMBEDDING_MODEL = "Marengo-retrieval-2.7"
 SEGMENT_DURATION = 6  # seconds per segment
 TOP_K = 5  # number of results to return in similarity search
+TASK_IDS_FILE = 'video_task_ids.json'  # maps video path -> embedding task id
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.webm'})  # files picked up from a directory
+POLL_INITIAL_DELAY = 2  # seconds before the first embedding task status check
+POLL_BACKOFF = 1.5  # multiplier applied to the delay after each check
+POLL_MAX_DELAY = 30  # upper bound on seconds between status checks
+MAX_INFLIGHT = 4  # videos processed concurrently when storing a directory
+SUBMIT_JITTER = 1.0  # max seconds of random delay before each video starts, avoids API bursts (HTTP 429)
+TASK_CACHE_SIZE = 16  # retrieved embedding tasks kept in memory (each holds every segment vector)
+POOL_MIN = 2  # connections opened when the pool is created
+POOL_MAX = 16  # upper bound on concurrent database sessions
+STMT_CACHE_SIZE = 40  # parsed statements cached per pooled connection
 
+# Oracle connection pool shared by all calls, created on first use by get_pool()
+_pool = None
+_pool_lock = threading.Lock()
+
+# Guards the shared task_ids mapping and its JSON file across worker threads
+_task_ids_lock = threading.Lock()
+
+
+def init_thick_mode():
+    """Use python-oracledb thick mode when ORACLE_CLIENT_LIB_DIR points at Oracle Client libraries.
+
+    Thick mode marshals VECTOR binds in C through OCI array DML, which is
+    noticeably faster for executemany() of wide embedding rows. It is opt-in:
+    without ORACLE_CLIENT_LIB_DIR the script stays in thin mode.
+    """
+    if not oracle_client_lib_dir:
+        return
+    try:
+        # Thick mode ignores the wallet arguments of create_pool() and reads
+        # tnsnames.ora/sqlnet.ora and the wallet from config_dir instead
+        oracledb.init_oracle_client(lib_dir=oracle_client_lib_dir, config_dir=db_wallet_path)
+    except oracledb.Error as e:
+        print(f"Oracle Client libraries could not be loaded, using thin mode ({e})")
+        return
+    # Thick mode can't be switched off again, so an old client is fatal rather than a fallback
+    if oracledb.clientversion() < (23,):
+        sys.exit("ORACLE_CLIENT_LIB_DIR must point to Oracle Client 23ai or later for VECTOR binds; "
+                 "unset it to use thin mode")
+    print("Using python-oracledb thick mode")
+
+def get_pool():
+    """Return the shared Oracle connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            init_thick_mode()
+            pool = oracledb.create_pool(
+                user=db_username,
+                password=db_password,
+                dsn=db_connect_string,
+                config_dir=db_wallet_path,
+                wallet_location=db_wallet_path,
+                wallet_password=db_password,
+                min=POOL_MIN,
+                max=POOL_MAX,
+                increment=1,
+                stmtcachesize=STMT_CACHE_SIZE
+            )
+            pool.ping_interval = 60
+            
+            # Verify DB version
+            with pool.acquire() as connection:
+                db_version = tuple(int(s) for s in connection.version.split("."))[:2]
+            if db_version < (23, 7):
+                sys.exit("This example requires Oracle Database 23.7 or later")
+            print("Connected to Oracle Database")
+            _pool = pool
+    return _pool
+
+def normalize_rows(vectors):
+    """Scale each row of a float32 matrix to unit length, in place"""
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    return vectors
+
+def quantize_int8(vectors):
+    """Quantize the rows of a float32 matrix to int8 codes with per-row scales (value ~= code * scale)"""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
 
 def on_task_update(task: EmbeddingsTask):
     print(f"  Status={task.status}")
@@ -42,143 +130,188 @@ def create_video_embeddings(client, video_file):
     )
     print(f"Created task: id={task.id} model_name={EMBEDDING_MODEL} status={task.status}")
 
-    status = task.wait_for_done(
-        sleep_interval=2,
-        callback=on_task_update
-    )
-    print(f"Embedding done: {status}")
+    # Poll with exponential backoff: embedding tasks usually take minutes, so a fixed
+    # short interval spends most of its API calls on tasks that are nowhere near done
+    delay = POLL_INITIAL_DELAY
+    while task.status not in ("ready", "failed"):
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+        task = client.embed.task.retrieve(task.id)
+        on_task_update(task)
+    print(f"Embedding done: {task.status}")
     
     return task.id
 
+@functools.lru_cache(maxsize=TASK_CACHE_SIZE)
+def _retrieve_task(task_id):
+    """Retrieve a completed embedding task (cached, finished tasks do not change)"""
+    return twelvelabs_client.embed.task.retrieve(task_id)
+
+def count_stored_embeddings(connection, task_id):
+    """Count the rows already stored for a task (row ids are '<task_id>_<segment index>')"""
+    prefix = task_id.replace("\\", "\\\\").replace("_", "\\_").replace("%", "\\%")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM video_embeddings WHERE id LIKE :1 ESCAPE '\\'",
+            [prefix + "\\_%"]
+        )
+        return cursor.fetchone()[0]
+
+def iter_embedding_rows(task_id, video_file, segments, chunk_size):
+    """Yield insert rows for segments, normalizing and quantizing chunk_size segments at a time"""
+    for start in range(0, len(segments), chunk_size):
+        chunk = segments[start:start + chunk_size]
+        # One contiguous (N, 1024) matrix per chunk; code * scale reconstructs a unit vector,
+        # so client-side similarity is a plain dot product
+        codes, scales = quantize_int8(normalize_rows(
+            np.array([segment.embeddings_float for segment in chunk], dtype=np.float32)
+        ))
+        for offset, segment in enumerate(chunk):
+            yield (
+                f"{task_id}_{start + offset}",
+                video_file,
+                segment.start_offset_sec,
+                segment.end_offset_sec,
+                array.array("b", codes[offset].tobytes()),
+                float(scales[offset])
+            )
+
 def store_embeddings_in_db(connection, task_id, video_file):
     """Store video embeddings in Oracle DB"""
-    task = twelvelabs_client.embed.task.retrieve(task_id)
+    task = _retrieve_task(task_id)
     
     # Get embeddings from the task
     if not task.video_embedding or not task.video_embedding.segments:
         print("No embeddings found")
         return
     
+    segments = task.video_embedding.segments
+    if count_stored_embeddings(connection, task_id) == len(segments):
+        print(f"All {len(segments)} embeddings already stored, skipping")
+        return
+    
+    # MERGE skips rows that already exist, so a partially stored video can be re-run safely
     insert_sql = """
-    INSERT INTO video_embeddings (
-        id, video_file, start_time, end_time, embedding_vector
+    MERGE INTO video_embeddings ve
+    USING (
+        SELECT :1 AS id, :2 AS video_file, :3 AS start_time, :4 AS end_time,
+               :5 AS embedding_vector, :6 AS scale
+        FROM dual
+    ) src
+    ON (ve.id = src.id)
+    WHEN NOT MATCHED THEN INSERT (
+        id, video_file, start_time, end_time, embedding_vector, scale
     ) VALUES (
-        :1, :2, :3, :4, :5
+        src.id, src.video_file, src.start_time, src.end_time, src.embedding_vector, src.scale
     )"""
     
-    BATCH_SIZE = 1000
-    data_batch = []
+    BATCH_SIZE = 5000
+    rows = iter_embedding_rows(task_id, video_file, segments, BATCH_SIZE)
     
     with connection.cursor() as cursor:
-        for idx, segment in enumerate(task.video_embedding.segments):
-            id = f"{task_id}_{idx}"
-            vector = array.array("f", segment.embeddings_float)
-            
-            data_batch.append([
-                id,
-                video_file,
-                segment.start_offset_sec,
-                segment.end_offset_sec,
-                vector
-            ])
-            
-            # Execute and commit every BATCH_SIZE rows
-            if len(data_batch) >= BATCH_SIZE:
-                print("insert data")
-                cursor.executemany(insert_sql, data_batch)
-                connection.commit()
-                data_batch = []
+        # Parse the statement once; each executemany(None, ...) reuses it
+        cursor.prepare(insert_sql)
+        # Declare bind types up front so the driver allocates bind buffers once
+        cursor.setinputsizes(
+            None,
+            None,
+            oracledb.DB_TYPE_NUMBER,
+            oracledb.DB_TYPE_NUMBER,
+            oracledb.DB_TYPE_VECTOR,
+            oracledb.DB_TYPE_NUMBER
+        )
         
-        # Insert any remaining rows
-        if data_batch:
-            print("insert data final")
-            cursor.executemany(insert_sql, data_batch)
-            connection.commit()
+        # Execute every BATCH_SIZE rows; only one batch of rows is materialized at a time
+        while True:
+            data_batch = list(itertools.islice(rows, BATCH_SIZE))
+            if not data_batch:
+                break
+            print("insert data")
+            cursor.executemany(None, data_batch)
+    
+    # Commit once per video rather than once per batch
+    connection.commit()
 
     print(f"Stored {len(task.video_embedding.segments)} embeddings in database")
 
 def load_task_ids():
     """Load existing task IDs from JSON file"""
     try:
-        with open('video_task_ids.json', 'r') as f:
+        with open(TASK_IDS_FILE, 'r') as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
 
 def save_task_ids(task_ids):
-    """Save task IDs to JSON file"""
-    with open('video_task_ids.json', 'w') as f:
+    """Save task IDs to JSON file atomically, so an interrupted write never corrupts it"""
+    tmp_path = TASK_IDS_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
         json.dump(task_ids, f, indent=2)
+    os.replace(tmp_path, TASK_IDS_FILE)
+
+def store_embeddings_from_pool(task_id, video_file):
+    """Store video embeddings using a connection from the shared pool"""
+    with get_pool().acquire() as connection:
+        store_embeddings_in_db(connection, task_id, video_file)
 
-def process_video(connection, video_path):
-    """Process a single video file"""
+def process_video(video_path, task_ids):
+    """Process a single video file, recording new task IDs in task_ids"""
     print(f"\nProcessing video: {video_path}")
     
-    # Load existing task IDs
-    task_ids = load_task_ids()
-    
     # If video was already processed, use existing task_id to store embeddings
-    if video_path in task_ids:
-        task_id = task_ids[video_path]
+    with _task_ids_lock:
+        task_id = task_ids.get(video_path)
+    if task_id:
         print(f"Video previously processed with task_id: {task_id}")
         print("Re-storing embeddings in database...")
         try:
-            store_embeddings_in_db(connection, task_id, video_path)
+            store_embeddings_from_pool(task_id, video_path)
         except Exception as e:
             print(f"Error storing embeddings for {video_path}: {str(e)}")
         return
     
     try:
-        # Create embeddings and store in DB
+        # Create embeddings and store in DB; a pooled connection is only held for the insert,
+        # not while waiting on the embedding task
         print("Creating video embeddings...")
         task_id = create_video_embeddings(twelvelabs_client, video_path)
         
-        # Store task_id in JSON
-        task_ids[video_path] = task_id
-        save_task_ids(task_ids)
+        # Store task_id in JSON right away, a finished task is expensive to recreate
+        with _task_ids_lock:
+            task_ids[video_path] = task_id
+            save_task_ids(task_ids)
         
         print("Storing embeddings in database...")
-        store_embeddings_in_db(connection, task_id, video_path)
+        store_embeddings_from_pool(task_id, video_path)
     except Exception as e:
         print(f"Error processing video {video_path}: {str(e)}")
 
+def _process_video_with_jitter(video_path, task_ids):
+    """Process a video after a short random delay so concurrent workers don't hit the API at once"""
+    time.sleep(random.uniform(0, SUBMIT_JITTER))
+    process_video(video_path, task_ids)
+
 def store_video_embeddings(video_path):
     """Process video file(s) and store embeddings in Oracle DB"""
-    try:
-        connection = oracledb.connect(
-            user=db_username,
-            password=db_password,
-            dsn=db_connect_string,
-            config_dir=db_wallet_path,
-            wallet_location=db_wallet_path,
-            wallet_password=db_password
-        )
-        connection.autocommit = True  # Enable autocommit
-        
-        # Verify DB version
-        db_version = tuple(int(s) for s in connection.version.split("."))[:2]
-        if db_version < (23, 7):
-            sys.exit("This example requires Oracle Database 23.7 or later")
-        print("Connected to Oracle Database")
-        
-        if not os.path.exists(video_path):
-            print(f"Path not found: {video_path}")
-            sys.exit(1)
-        
-        # Process videos
-        if os.path.isfile(video_path):
-            process_video(connection, video_path)
-        else:
-            # Process all video files in the directory
-            video_extensions = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
-            for filename in os.listdir(video_path):
-                if filename.lower().endswith(video_extensions):
-                    video_file_path = os.path.join(video_path, filename)
-                    process_video(connection, video_file_path)
-                    
-    finally:
-        if 'connection' in locals():
-            connection.close()
+    if not os.path.exists(video_path):
+        print(f"Path not found: {video_path}")
+        sys.exit(1)
+    
+    # Connect (and verify the DB version) before starting any embedding tasks
+    get_pool()
+    
+    # Load existing task IDs once for the whole run
+    task_ids = load_task_ids()
+    
+    # Process videos
+    if os.path.isfile(video_path):
+        process_video(video_path, task_ids)
+    else:
+        # Process all video files in the directory, MAX_INFLIGHT at a time
+        with ThreadPoolExecutor(max_workers=MAX_INFLIGHT) as executor, os.scandir(video_path) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                    executor.submit(_process_video_with_jitter, entry.path, task_ids)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Store video embeddings')
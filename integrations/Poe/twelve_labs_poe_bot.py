@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from typing import AsyncIterable
-from enum import Enum
+from enum import IntEnum
 
 import fastapi_poe as fp
 from modal import App, Image, asgi_app, Volume, Secret, web_endpoint
@@ -10,18 +10,23 @@ from twelvelabs import TwelveLabs
 import twelvelabs
 import time
 import os
-import json
-import fcntl
+import msgspec
+import functools
 import asyncio
 import logging
+import re
 import mimetypes
 from pathlib import Path
 import subprocess
+import tempfile
 from tempfile import NamedTemporaryFile
 import aiohttp
 import math
-import hashlib
-import shutil
+import bisect
+import weakref
+import io
+import xxhash
+from collections import OrderedDict, deque
 
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
@@ -59,6 +64,79 @@ TWELVE_LABS_OUTPUT_TOKEN_COST = BASE_OUTPUT_TOKEN_COST / PRICE_REDUCTION_FACTOR
 
 FREE_VIDEO_DURATION_MINUTES = 1
 
+USER_CACHE_SIZE = 4096  # user data dicts kept in memory between requests
+HASH_CHUNK_SIZE = 1 << 20  # bytes written and hashed per step when downloading videos
+TASK_POLL_INITIAL_DELAY = 2  # seconds before the second task status check
+TASK_POLL_MAX_DELAY = 30  # cap on the backed-off delay between status checks
+TASK_POLL_BACKOFF = 1.5  # delay multiplier after each status check
+HEARTBEAT_INTERVAL = 3  # seconds between progress dots while waiting for a task
+DOWNLOAD_CACHE_SIZE = 32  # downloads of unprocessed URLs kept on disk for a retry
+DOWNLOAD_CACHE_TTL = 3600  # seconds a kept download stays valid
+
+# x264 settings for highlight/chapter clips. Clips are stored and served over HTTP, so
+# a slower preset that shrinks them pays off; set SEGMENT_X264_PRESET=ultrafast on CPU-starved hosts
+SEGMENT_X264_PRESET = os.environ.get("SEGMENT_X264_PRESET", "veryfast")
+SEGMENT_CRF = 23  # constant-quality rate control (x264 default quality)
+SOURCE_CACHE_MAX_BYTES = 4 << 30  # local copies of segment source videos kept on the volume
+KEYFRAME_SNAP_TOLERANCE = 1.0  # max seconds a clip start moves back to a keyframe for stream copy
+PIPE_READ_SIZE = 64 * 1024  # bytes per read of a segment clip from its ffmpeg pipe
+STDERR_TAIL_LINES = 200  # last lines of ffmpeg/ffprobe stderr kept for error messages
+FFMPEG_QUIET_ARGS = ['-hide_banner', '-loglevel', 'error', '-nostats']  # only errors on stderr
+# Threads per ffmpeg run, split across its decoders and encoders, so concurrent requests share
+# the container's cores instead of each spawning threads per core
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", "4"))
+# Low-latency x264 threading: slice threads add no frame delay and no lookahead is buffered
+X264_LOW_LATENCY_PARAMS = 'sliced-threads=1:sync-lookahead=0:rc-lookahead=0'
+FINGERPRINT_SIZE = 8  # thumbnail side in pixels for perceptual video fingerprints (64-bit hash)
+FINGERPRINT_MAX_DISTANCE = 6  # max differing bits for two frame hashes to count as the same frame
+FINGERPRINT_SAMPLES = 64  # frame hashes kept per fingerprint, spread evenly over the video
+FINGERPRINT_MIN_FRAMES = 5  # shorter videos are only matched by content hash
+FINGERPRINT_MIN_MATCH = 0.9  # fraction of sampled frames that must match for the same video
+
+# Hardware H.264 encoders tried in order before falling back to libx264
+HW_H264_ENCODERS = ('h264_nvenc', 'h264_videotoolbox')
+H264_ENCODER_ARGS = {
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p1', '-profile:v', 'baseline', '-b:v', '1M'],
+    'h264_videotoolbox': ['-c:v', 'h264_videotoolbox', '-profile:v', 'baseline', '-b:v', '1M'],
+    'libx264': [
+        '-c:v', 'libx264',
+        '-preset', 'ultrafast',  # Fastest encoding preset
+        '-tune', 'fastdecode',   # Optimize for fast decoding
+        '-profile:v', 'baseline', # Simpler profile for faster encoding
+        '-level', '3.0',         # Compatible level for mobile/web
+        '-threads', str(FFMPEG_THREADS // 2 or 1), # Half the run's budget, decoding gets the rest
+        '-x264-params', X264_LOW_LATENCY_PARAMS,
+    ],
+}
+
+# Video codec arguments for highlight/chapter clips. Hardware encoders use the upscale settings;
+# the libx264 fallback trades encode speed for smaller clips
+SEGMENT_ENCODER_ARGS = {
+    **H264_ENCODER_ARGS,
+    'libx264': [
+        '-c:v', 'libx264',
+        '-preset', SEGMENT_X264_PRESET, # Smaller clips to store and serve than ultrafast
+        '-crf', str(SEGMENT_CRF),
+        '-tune', 'fastdecode',   # Optimize for fast decoding
+        '-profile:v', 'baseline', # Simpler profile for faster encoding
+        '-level', '3.0',         # Compatible level for mobile/web
+        '-x264-params', X264_LOW_LATENCY_PARAMS, # Threads are set per clip, see _extract_segments
+    ],
+}
+
+# URL classification patterns, compiled once. Twelve Labs supports all ffmpeg supported formats;
+# a query string or fragment may follow the extension
+YOUTUBE_URL_RE = re.compile(r'youtube\.com|youtu\.be', re.IGNORECASE)
+VIDEO_EXTENSION_RE = re.compile(
+    r'\.(mp4|mov|avi|wmv|flv|webm|mkv|3gp|3g2|mj2|asf|dv|f4v|gif|m2ts|m2v|m4v|mjpeg|mpg|mpeg'
+    r'|mts|mxf|ogv|rm|rmvb|ts|vob)(\?|#|$)',
+    re.IGNORECASE
+)
+
+# Whitespace-separated words, used to estimate token counts for pricing
+WORD_RE = re.compile(r'\S+')
+SOURCE_NAME_RE = re.compile(r'[0-9a-f]{16}\.\w+$')  # finished source copies: <xxh3_64 of URL><ext>
+
 logger.info(f"Running in {'TEST' if TEST_MODE else 'PRODUCTION'} mode")
 logger.info(f"Price reduction factor: {PRICE_REDUCTION_FACTOR}x")
 logger.info(f"Video indexing cost: {TWELVE_LABS_VIDEO_INDEXING_COST} millicents per minute")
@@ -67,16 +145,96 @@ logger.info(f"Storage cost: {TWELVE_LABS_STORAGE_COST} millicents per minute")
 logger.info(f"Input token cost: {TWELVE_LABS_INPUT_TOKEN_COST} millicents per 1000 tokens")
 logger.info(f"Output token cost: {TWELVE_LABS_OUTPUT_TOKEN_COST} millicents per 1000 tokens")
 
-class VideoUrlType(Enum):
-    DIRECT = "direct"
-    YOUTUBE = "youtube"
-    INVALID = "invalid"
-    NOT_URL = "not_url"
+class VideoUrlType(IntEnum):
+    DIRECT = 0
+    YOUTUBE = 1
+    INVALID = 2
+    NOT_URL = 3
+
+class UserData(msgspec.Struct, omit_defaults=True):
+    """Per-conversation state persisted to the storage volume"""
+    video_id: str | None = None
+    index_id: str | None = None
+    processing_task: str | None = None
+    processing_url: str | None = None
+    conversation_id: str | None = None
+    pending_question: str | None = None
+    upload_message: str | None = None
+    duration_minutes: float | None = None  # duration of the current video, for text generation pricing
+    processed_videos: dict[str, str | None] = {}  # video URL/hash -> video_id mapping
+
+# Reused (de)serializers for the user data files; msgpack is smaller and faster to parse than JSON
+USER_DATA_ENCODER = msgspec.msgpack.Encoder()
+USER_DATA_DECODER = msgspec.msgpack.Decoder(UserData)
+LEGACY_USER_DATA_DECODER = msgspec.json.Decoder(UserData)
 
 class VideoDurationError(Exception):
     """Custom exception for video duration validation"""
     pass
 
+# Billing and fixed-text responses repeat across requests, so they are built once and reused
+@functools.lru_cache(maxsize=4096)
+def _cost_item(amount, description):
+    return fp.CostItem(amount_usd_milli_cents=amount, description=description)
+
+@functools.lru_cache(maxsize=64)
+def _text_response(text):
+    return fp.PartialResponse(text=text)
+
+@functools.lru_cache(maxsize=None)
+def _upscale_output_args(target_width, target_height, encoder, copy_audio, fragmented=False):
+    """ffmpeg output options for upscale_video, built once per target size, encoder and output mode"""
+    return (
+        '-vf', f'scale={target_width}:{target_height}:flags=fast_bilinear',
+        *H264_ENCODER_ARGS[encoder],
+        # A fragmented MP4 can be written to a pipe; +faststart needs a seekable output file
+        *(('-f', 'mp4', '-movflags', '+frag_keyframe+empty_moov') if fragmented
+          else ('-movflags', '+faststart')), # Optimize for web playback
+        # Remux AAC audio as-is, only other codecs need a re-encode
+        *(('-c:a', 'copy') if copy_audio else ('-c:a', 'aac', '-b:a', '128k')),
+    )
+
+@functools.lru_cache(maxsize=1)
+def _build_settings(prices):
+    """Build the bot settings for a (video, audio, storage, input token, output token) price tuple"""
+    video_indexing_cost, audio_indexing_cost, storage_cost, input_token_cost, output_token_cost = prices
+    rate_card = (
+        "# 🎥 Video Processing Costs\n\n"
+        "Videos under 1 minute are **FREE**! For longer videos:\n\n"
+        "| Service | Cost per Minute |\n"
+        "|---------|----------------|\n"
+        f"| Visual Analysis | [amount_usd_milli_cent={video_indexing_cost}] |\n"
+        f"| Audio Analysis | [amount_usd_milli_cent={audio_indexing_cost}] |\n"
+        f"| Storage | [amount_usd_milli_cent={storage_cost}] |\n\n"
+        "# 💬 Question Costs\n\n"
+        "Each question about your video has two components:\n\n"
+        "| Component | Cost per 1000 Tokens |\n"
+        "|-----------|------------------|\n"
+        f"| Your Question | [amount_usd_milli_cent={math.ceil(input_token_cost * 1000)}] |\n"
+        f"| AI Response | [amount_usd_milli_cent={math.ceil(output_token_cost * 1000)}] |\n\n"
+        "💡 **Tips to Save Points:**\n"
+        "1. Upload shorter videos (under 1 minute is free!)\n"
+        "2. Ask concise questions\n"
+        "3. Use commands like 'summary', 'chapters' or 'highlights' for efficient overviews"
+    )
+
+    return fp.SettingsResponse(
+        allow_attachments=True,
+        custom_rate_card=rate_card,
+        introduction_message=(
+            "Hi! I'm Pegasus! 👋 I can help you understand videos just like a human would! "
+            f"To get started, please share a video that's {MIN_VIDEO_DURATION} seconds - {MAX_VIDEO_DURATION//60} minutes long - you can upload a file or share a URL. "
+            "**Note that I can't accept YouTube URLs or other non-publicly available URLs at this point.**\n\n"
+            "💡 Tip: Videos under 1 minute are free!\n\n"
+            "Once your video is processed, here's how you can interact with it:\n"
+            "1. Ask open ended questions about the video\n"
+            "2. Say \"Summarize\" or \"Summary\" to generate a summary of your video\n"
+            "3. Say \"Chapter\" to break the video down by chapter and see a summary of each chapter\n"
+            "4. Say \"Highlight\" to generate a list of highlights for your video\n\n"
+            "Let's explore your videos together!"
+        )
+    )
+
 class TwelveLabsBot(fp.PoeBot):
 
     """
@@ -126,6 +284,9 @@ class TwelveLabsBot(fp.PoeBot):
     GENERATING_HIGHLIGHTS_TEXT = "\n\nGenerating highlight clips...\n\n"
     GENERATING_CHAPTERS_TEXT = "\n\nGenerating chapter clips...\n\n"
 
+    # H.264 encoder used for upscaling, chosen on first use by _h264_encoder()
+    _h264_encoder_name = None
+
     def __init__(self, api_key, storage_dir):
         super().__init__()
         self.client = TwelveLabs(api_key=api_key)
@@ -133,97 +294,139 @@ class TwelveLabsBot(fp.PoeBot):
         # Create segments directory
         self.segments_dir = Path(storage_dir) / "segments"
         self.segments_dir.mkdir(parents=True, exist_ok=True)
+        # Local copies of the videos clips are cut from, so ffmpeg seeks on disk instead of over HTTP
+        self.sources_dir = Path(storage_dir) / "sources"
+        self.sources_dir.mkdir(parents=True, exist_ok=True)
+        # Source downloads in progress, renamed into sources_dir once complete
+        self.partial_sources_dir = self.sources_dir / "partial"
+        self.partial_sources_dir.mkdir(exist_ok=True)
+        # LRU of user_id -> (file mtime_ns, user data), re-read only when the file changes
+        self._user_cache = OrderedDict()
+        # Per-user locks serializing user data reads and writes within this container. Weak values,
+        # so a lock goes away once no request holds or waits on it instead of piling up per user
+        self._user_locks = weakref.WeakValueDictionary()
+        # LRU of URL key -> (downloaded path, content hash, expiry monotonic_ns) for URLs whose
+        # processing didn't complete, so a retry of the same link skips the download
+        self._download_cache = OrderedDict()
+        
+        # Suggested replies never change, so they are built once and reused by every request
+        self._suggested_replies = tuple(
+            fp.PartialResponse(text=text, is_suggested_reply=True)
+            for text in ("Summarize this video.", "Generate highlights.", "Generate chapter summaries.")
+        )
+        # Chat commands, checked in order; "summar" matches both "summarize" and "summary"
+        self._command_handlers = (
+            ("chapter", self._handle_chapters),
+            ("highlight", self._handle_highlights),
+            ("summar", self._handle_summary),
+        )
         logger.info(f"Initialized TwelveLabsBot with storage directory: {storage_dir}")
 
+    def _user_lock(self, user_id):
+        """Return the lock for a user's data, creating it if no request is using one"""
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
     def _get_user_data_path(self, user_id):
+        return os.path.join(self.storage_dir, f"user_{user_id}.msgpack")
+
+    def _get_legacy_user_data_path(self, user_id):
         return os.path.join(self.storage_dir, f"user_{user_id}.json")
         
-    def _load_user_data(self, user_id):
+    async def _load_user_data(self, user_id):
         path = self._get_user_data_path(user_id)
-        default_data = {
-            "video_id": None, 
-            "index_id": None,
-            "processing_task": None,
-            "processing_url": None,
-            "conversation_id": None,
-            "pending_question": None,
-            "processed_videos": {}  # Add this to store video URL/hash -> video_id mapping
-        }
+        decode = USER_DATA_DECODER.decode
         
-        if os.path.exists(path):
-            logger.debug(f"Loading user data for user_id: {user_id}")
+        async with self._user_lock(user_id):
             try:
-                with open(path, 'r') as f:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                    try:
-                        loaded_data = json.load(f)
-                        default_data.update(loaded_data)
-                        return default_data
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse user data JSON: {e}")
-                        return default_data
-                    finally:
-                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            except IOError as e:
-                logger.error(f"Failed to read user data file: {e}")
-                return default_data
-        logger.debug(f"Using default data for user_id: {user_id}")
-        return default_data
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                # Fall back to the JSON file written before the switch to msgpack;
+                # the next save migrates it
+                path = self._get_legacy_user_data_path(user_id)
+                decode = LEGACY_USER_DATA_DECODER.decode
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+            
+            if mtime_ns is not None:
+                cached = self._user_cache.get(user_id)
+                if cached and cached[0] == mtime_ns:
+                    self._user_cache.move_to_end(user_id)
+                    return self._copy_user_data(cached[1])
+                
+                logger.debug(f"Loading user data for user_id: {user_id}")
+                try:
+                    with open(path, 'rb') as f:
+                        user_data = decode(f.read())
+                        self._cache_user_data(user_id, os.fstat(f.fileno()).st_mtime_ns, user_data)
+                        return user_data
+                except msgspec.DecodeError as e:
+                    logger.error(f"Failed to parse user data: {e}")
+                    return UserData()
+                except IOError as e:
+                    logger.error(f"Failed to read user data file: {e}")
+                    return UserData()
+            logger.debug(f"Using default data for user_id: {user_id}")
+            return UserData()
         
-    def _save_user_data(self, user_id, data):
+    async def _save_user_data(self, user_id, data):
         path = self._get_user_data_path(user_id)
         try:
-            os.makedirs(self.storage_dir, exist_ok=True)
-            with open(path, 'w') as f:
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                try:
-                    json.dump(data, f)
-                except (TypeError, ValueError) as e:
-                    logger.error(f"Failed to serialize user data: {e}")
-                finally:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-        except IOError as e:
-            logger.error(f"Failed to write user data file: {e}")
+            serialized = USER_DATA_ENCODER.encode(data)
+        except (TypeError, msgspec.EncodeError) as e:
+            logger.error(f"Failed to serialize user data: {e}")
+            return
+        
+        async with self._user_lock(user_id):
+            tmp_path = None
+            try:
+                os.makedirs(self.storage_dir, exist_ok=True)
+                # Write a temp file in the same directory and rename it over the old one. The rename
+                # is atomic, so a crash mid-write can't corrupt the file and lose processed_videos
+                fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, prefix=f"user_{user_id}.", suffix=".tmp")
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(serialized)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                os.replace(tmp_path, path)
+                tmp_path = None
+                self._cache_user_data(user_id, mtime_ns, data)
+            except IOError as e:
+                logger.error(f"Failed to write user data file: {e}")
+            finally:
+                if tmp_path:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def _copy_user_data(data):
+        """Copy user data; processed_videos is the only field mutated in place"""
+        return msgspec.structs.replace(data, processed_videos=dict(data.processed_videos))
+
+    def _cache_user_data(self, user_id, mtime_ns, data):
+        """Store a private copy of the user's data, evicting the least recently used entry"""
+        self._user_cache[user_id] = (mtime_ns, self._copy_user_data(data))
+        self._user_cache.move_to_end(user_id)
+        if len(self._user_cache) > USER_CACHE_SIZE:
+            self._user_cache.popitem(last=False)
 
     
 
     async def get_settings(self, setting: fp.SettingsRequest) -> fp.SettingsResponse:
-        rate_card = (
-            "# 🎥 Video Processing Costs\n\n"
-            "Videos under 1 minute are **FREE**! For longer videos:\n\n"
-            "| Service | Cost per Minute |\n"
-            "|---------|----------------|\n"
-            f"| Visual Analysis | [amount_usd_milli_cent={TWELVE_LABS_VIDEO_INDEXING_COST}] |\n"
-            f"| Audio Analysis | [amount_usd_milli_cent={TWELVE_LABS_AUDIO_INDEXING_COST}] |\n"
-            f"| Storage | [amount_usd_milli_cent={TWELVE_LABS_STORAGE_COST}] |\n\n"
-            "# 💬 Question Costs\n\n"
-            "Each question about your video has two components:\n\n"
-            "| Component | Cost per 1000 Tokens |\n"
-            "|-----------|------------------|\n"
-            f"| Your Question | [amount_usd_milli_cent={math.ceil(TWELVE_LABS_INPUT_TOKEN_COST * 1000)}] |\n"
-            f"| AI Response | [amount_usd_milli_cent={math.ceil(TWELVE_LABS_OUTPUT_TOKEN_COST * 1000)}] |\n\n"
-            "💡 **Tips to Save Points:**\n"
-            "1. Upload shorter videos (under 1 minute is free!)\n"
-            "2. Ask concise questions\n"
-            "3. Use commands like 'summary', 'chapters' or 'highlights' for efficient overviews"
-        )
-        
-        return fp.SettingsResponse(
-            allow_attachments=True,
-            custom_rate_card=rate_card,
-            introduction_message=(
-                "Hi! I'm Pegasus! 👋 I can help you understand videos just like a human would! "
-                "To get started, please share a video that's 4 seconds - 20 minutes long - you can upload a file or share a URL. "
-                "**Note that I can't accept YouTube URLs or other non-publicly available URLs at this point.**\n\n"
-                "💡 Tip: Videos under 1 minute are free!\n\n"
-                "Once your video is processed, here's how you can interact with it:\n"
-                "1. Ask open ended questions about the video\n"
-                "2. Say \"Summarize\" or \"Summary\" to generate a summary of your video\n"
-                "3. Say \"Chapter\" to break the video down by chapter and see a summary of each chapter\n"
-                "4. Say \"Highlight\" to generate a list of highlights for your video\n\n"
-                "Let's explore your videos together!"
-            )
-        )
+        return _build_settings((
+            TWELVE_LABS_VIDEO_INDEXING_COST,
+            TWELVE_LABS_AUDIO_INDEXING_COST,
+            TWELVE_LABS_STORAGE_COST,
+            TWELVE_LABS_INPUT_TOKEN_COST,
+            TWELVE_LABS_OUTPUT_TOKEN_COST
+        ))
 
 
     def is_valid_video_url(self, url):
@@ -237,27 +440,15 @@ class TwelveLabsBot(fp.PoeBot):
             return VideoUrlType.NOT_URL
         
         # Check if the URL starts with http:// or https://
-        if not (url.startswith('http://') or url.startswith('https://')):
+        if not url.startswith(('http://', 'https://')):
             return VideoUrlType.NOT_URL
         
         # Check for YouTube URLs
-        youtube_patterns = [
-            'youtube.com',
-            'youtu.be'
-        ]
-        if any(pattern in url.lower() for pattern in youtube_patterns):
+        if YOUTUBE_URL_RE.search(url):
             return VideoUrlType.YOUTUBE
         
-        # Twelve Labs supports all ffmpeg supported formats
-        video_extensions = [
-            '.mp4', '.mov', '.avi', '.wmv', '.flv', '.webm', '.mkv',
-            '.3gp', '.3g2', '.mj2', '.asf', '.dv', '.f4v', '.gif',
-            '.m2ts', '.m2v', '.m4v', '.mjpeg', '.mpg', '.mpeg',
-            '.mts', '.mxf', '.ogv', '.rm', '.rmvb', '.ts', '.vob'
-        ]
-        
         # Check if the URL ends with any of the supported extensions
-        if any(url.lower().endswith(ext) for ext in video_extensions):
+        if VIDEO_EXTENSION_RE.search(url):
             return VideoUrlType.DIRECT
         
         return VideoUrlType.INVALID
@@ -267,29 +458,20 @@ class TwelveLabsBot(fp.PoeBot):
         self, request: fp.QueryRequest
     ) -> AsyncIterable[fp.PartialResponse]:
         
-        yield fp.PartialResponse(
-            text="Summarize this video.",
-            is_suggested_reply=True
-        )
-        yield fp.PartialResponse(
-            text="Generate highlights.",
-            is_suggested_reply=True
-        )
-        yield fp.PartialResponse(
-            text="Generate chapter summaries.",
-            is_suggested_reply=True
-        )
+        for suggested_reply in self._suggested_replies:
+            yield suggested_reply
 
         logger.info(f"Received request for conversation: {request.conversation_id}")
         
         # Load user data at start of response
-        user_data = self._load_user_data(request.conversation_id)
-        user_data["conversation_id"] = request.conversation_id
-        self._save_user_data(request.conversation_id, user_data)
+        user_data = await self._load_user_data(request.conversation_id)
+        if user_data.conversation_id != request.conversation_id:
+            user_data.conversation_id = request.conversation_id
+            await self._save_user_data(request.conversation_id, user_data)
         
         # Use user_data instead of instance variables
-        video_id = user_data["video_id"]
-        index_id = user_data["index_id"]
+        video_id = user_data.video_id
+        index_id = user_data.index_id
         
         last_message = request.query[-1].content
         
@@ -303,7 +485,7 @@ class TwelveLabsBot(fp.PoeBot):
         video_url_type = self.is_valid_video_url(last_message)
         if video_url_type == VideoUrlType.YOUTUBE:
             response = self.YOUTUBE_ERROR_MESSAGE
-            if user_data.get("video_id"):
+            if user_data.video_id:
                 response += self.STILL_ASK_QUESTIONS_MESSAGE
             logger.info(response)
             yield fp.PartialResponse(text=response)
@@ -314,12 +496,12 @@ class TwelveLabsBot(fp.PoeBot):
                 # Save the non-URL parts as pending question
                 question = ' '.join(word for word in last_message.split() if not word.startswith('http'))
                 if question.strip():
-                    user_data["pending_question"] = question.strip()
-                    self._save_user_data(request.conversation_id, user_data)
+                    user_data.pending_question = question.strip()
+                    await self._save_user_data(request.conversation_id, user_data)
                     logger.info(f"Saved pending question: {question.strip()}")
             
             response = self.INVALID_URL_MESSAGE
-            if user_data.get("video_id"):
+            if user_data.video_id:
                 response += self.STILL_ASK_QUESTIONS_MESSAGE
             logger.info(response)
             yield fp.PartialResponse(text=response)
@@ -328,62 +510,29 @@ class TwelveLabsBot(fp.PoeBot):
             # Save any text that comes before/after the URL as pending question
             question = ' '.join(word for word in last_message.split() if not word.startswith('http'))
             if question.strip():
-                user_data["pending_question"] = question.strip()
-                self._save_user_data(request.conversation_id, user_data)
+                user_data.pending_question = question.strip()
+                await self._save_user_data(request.conversation_id, user_data)
                 logger.info(f"Saved pending question: {question.strip()}")
 
+            # Reuse the indexed video if this URL was processed before
+            cached_video_id = user_data.processed_videos.get(self._video_url_key(last_message))
+            if cached_video_id:
+                logger.info(f"URL already processed, reusing video_id: {cached_video_id}")
+                user_data.video_id = cached_video_id
+                user_data.processing_task = None
+                user_data.processing_url = last_message
+                user_data.duration_minutes = None
+                await self._save_user_data(request.conversation_id, user_data)
+                async for status in self.wait_for_processing(request.conversation_id, request):
+                    yield status
+                return
+
             logger.info(f"Processing video URL: {last_message}")
             self.video_url = last_message
+            self.video_name = None
             
-            try:
-                # Create task and wait for processing
-                task_id = await self.create_pegasus_video_task(request.conversation_id, request)
-                
-                if isinstance(task_id, tuple) and task_id[0] == "error":
-                    # Show our custom error message
-                    yield fp.PartialResponse(text=task_id[1])
-                    # Clear any pending questions since we couldn't process the video
-                    user_data = self._load_user_data(request.conversation_id)
-                    user_data["pending_question"] = None
-                    self._save_user_data(request.conversation_id, user_data)
-                    return
-                elif task_id == "insufficient_fund":
-                    yield fp.ErrorResponse(
-                        text=(
-                            "⚠️ Sorry, you don't have enough points to process this video.\n\n"
-                            "Please check the rate card above for video processing costs.\n\n"
-                            "💡 Tip: Videos under 1 minute are free! Try uploading a shorter clip."
-                        ),
-                        error_type="insufficient_fund"
-                    )
-                    # Clear any pending questions since we couldn't process the video
-                    user_data = self._load_user_data(request.conversation_id)
-                    user_data["pending_question"] = None
-                    self._save_user_data(request.conversation_id, user_data)
-                    return
-                elif task_id is None:
-                    # Video was already processed, continue with existing video_id
-                    async for status in self.wait_for_processing(request.conversation_id, request):
-                        yield status
-                else:
-                    # Get the upload message with time estimate
-                    user_data = self._load_user_data(request.conversation_id)
-                    upload_message = user_data.get("upload_message", "Video uploaded, processing started! This may take a few minutes...")
-                    
-                    logger.info(f"Sending response: {upload_message}")
-                    yield fp.PartialResponse(text=upload_message)
-                    await asyncio.sleep(1)
-                    
-                    # New video being processed
-                    async for status in self.wait_for_processing(request.conversation_id, request):
-                        yield status
-
-            except Exception as e:
-                logger.error(f"Error processing video: {e}")
-                response = self.PROCESSING_FAILED_MESSAGE
-                if user_data.get("video_id"):
-                    response += self.STILL_ASK_QUESTIONS_MESSAGE
-                yield fp.PartialResponse(text=response)
+            async for status in self._handle_new_video(request, user_data):
+                yield status
             return
     
         elif is_attachment:
@@ -391,8 +540,8 @@ class TwelveLabsBot(fp.PoeBot):
             if "video" in attachment.content_type:
                 # Save any text message that came with the attachment
                 if last_message.strip():
-                    user_data["pending_question"] = last_message.strip()
-                    self._save_user_data(request.conversation_id, user_data)
+                    user_data.pending_question = last_message.strip()
+                    await self._save_user_data(request.conversation_id, user_data)
                     logger.info(f"Saved pending question: {last_message.strip()}")
 
                 logger.info(f"Processing video attachment: {attachment.name}")
@@ -400,81 +549,38 @@ class TwelveLabsBot(fp.PoeBot):
                 self.video_name = attachment.name
                 logger.info(f"Video filename: {attachment.name}")
                 
-                try:
-                    # Create task and check funds first
-                    result = await self.create_pegasus_video_task(request.conversation_id, request)
-                    
-                    if isinstance(result, tuple) and result[0] == "error":
-                        # Show our custom error message
-                        yield fp.PartialResponse(text=result[1])
-                        # Clear any pending questions since we couldn't process the video
-                        user_data = self._load_user_data(request.conversation_id)
-                        user_data["pending_question"] = None
-                        self._save_user_data(request.conversation_id, user_data)
-                        return
-                    elif result == "insufficient_fund":
-                        yield fp.ErrorResponse(
-                            text=(
-                                "⚠️ Sorry, you don't have enough points to process this video.\n\n"
-                                "Please check the rate card above for video processing costs.\n\n"
-                                "💡 Tip: Videos under 1 minute are free! Try uploading a shorter clip."
-                            ),
-                            error_type="insufficient_fund"
-                        )
-                    task_id = result  # If not an error, it's the task_id
-                    # Get the upload message with time estimate
-                    user_data = self._load_user_data(request.conversation_id)
-                    upload_message = user_data.get("upload_message", "Video uploaded, processing started! This may take a few minutes...")
-                    
-                    logger.info(f"Sending response: {upload_message}")
-                    yield fp.PartialResponse(text=upload_message)
-                    await asyncio.sleep(1)
-
-                    if task_id is None:
-                        # Video was already processed, continue with existing video_id
-                        async for status in self.wait_for_processing(request.conversation_id, request):
-                            yield status
-                    else:
-                        # New video being processed
-                        async for status in self.wait_for_processing(request.conversation_id, request):
-                            yield status
-
-                except Exception as e:
-                    logger.error(f"Error processing video: {e}")
-                    response = self.PROCESSING_FAILED_MESSAGE
-                    if user_data.get("video_id"):
-                        response += self.STILL_ASK_QUESTIONS_MESSAGE
-                    yield fp.PartialResponse(text=response)
+                async for status in self._handle_new_video(request, user_data):
+                    yield status
                 return
             else:
                 response = self.WRONG_FILE_TYPE_MESSAGE.format(content_type=attachment.content_type)
-                if user_data.get("video_id"):
+                if user_data.video_id:
                     response += self.STILL_ASK_QUESTIONS_MESSAGE
                 logger.info(f"Received non-video attachment: {attachment.content_type}")
                 yield fp.PartialResponse(text=response)
                 return
 
-        elif user_data.get("processing_task"):
+        elif user_data.processing_task:
             # Any message while processing should check status
-            task = self.client.task.retrieve(user_data["processing_task"])
+            task = await asyncio.to_thread(self.client.task.retrieve, user_data.processing_task)
             if task.status == "ready":
                 # Save video_id if not already saved
-                if not user_data.get("video_id"):
-                    user_data["video_id"] = task.video_id
-                    user_data["processing_task"] = None
-                    self._save_user_data(request.conversation_id, user_data)
+                if not user_data.video_id:
+                    user_data.video_id = task.video_id
+                    user_data.processing_task = None
+                    await self._save_user_data(request.conversation_id, user_data)
                 logger.info(f"Sending response: {self.PROCESSING_COMPLETE_MESSAGE}")
-                yield fp.PartialResponse(text=self.PROCESSING_COMPLETE_MESSAGE)
+                yield _text_response(self.PROCESSING_COMPLETE_MESSAGE)
             else:
                 logger.info(f"Sending response: {self.STILL_PROCESSING_MESSAGE}")
-                yield fp.PartialResponse(text=self.STILL_PROCESSING_MESSAGE)
+                yield _text_response(self.STILL_PROCESSING_MESSAGE)
                 await asyncio.sleep(1)
                 async for status in self.wait_for_processing(request.conversation_id, request):
                     if status.text == "ready":
-                        yield fp.PartialResponse(text=self.PROCESSING_COMPLETE_MESSAGE)
+                        yield _text_response(self.PROCESSING_COMPLETE_MESSAGE)
                         return
                     elif status.text == "timeout":
-                        yield fp.PartialResponse(text=self.CHECK_BACK_MESSAGE)
+                        yield _text_response(self.CHECK_BACK_MESSAGE)
                         return
                     else:
                         yield status
@@ -488,150 +594,247 @@ class TwelveLabsBot(fp.PoeBot):
             )
 
         else:
-            #chat with video
-            if "chapter" in last_message.lower():
-                res = self.client.generate.summarize(
-                    video_id=video_id,
-                    type="chapter",
-                )
-                
-                # Build formatted chapters text
-                chapters_text = "Here are the video chapters:\n\n"
-                for chapter in res.chapters.root:
-                    timestamp = f"{chapter.start:.1f}s - {chapter.end:.1f}s"
-                    chapters_text += f"Chapter {chapter.chapter_number + 1}: {chapter.chapter_title}\n"
-                    chapters_text += f"Time: {timestamp}\n"
-                    chapters_text += f"Summary: {chapter.chapter_summary}\n\n"
-                
-                success, error = await self.handle_text_generation_costs(request, last_message, chapters_text)
-                if not success:
-                    yield error
+            #chat with video, dispatching on the first command keyword found in the message
+            message = last_message.lower()
+            handler = next(
+                (handler for keyword, handler in self._command_handlers if keyword in message),
+                self._handle_freeform
+            )
+            async for response in handler(request, user_data, video_id, last_message):
+                yield response
+                if isinstance(response, fp.ErrorResponse):
                     return
 
-                # Send the chapters text
-                yield fp.PartialResponse(text=chapters_text)
+            yield fp.PartialResponse(
+                text=""
+            )
+                    
+    async def _handle_chapters(self, request, user_data, video_id, last_message):
+        """Summarize the video by chapter and post a clip of each chapter"""
+        res = await asyncio.to_thread(
+            self.client.generate.summarize,
+            video_id=video_id,
+            type="chapter",
+        )
 
-                print(chapters_text)
+        # Build formatted chapters text
+        parts = ["Here are the video chapters:\n\n"]
+        for chapter in res.chapters.root:
+            parts.append(
+                f"Chapter {chapter.chapter_number + 1}: {chapter.chapter_title}\n"
+                f"Time: {chapter.start:.1f}s - {chapter.end:.1f}s\n"
+                f"Summary: {chapter.chapter_summary}\n\n"
+            )
+        chapters_text = "".join(parts)
 
-                time.sleep(0.1)
+        success, error = await self.handle_text_generation_costs(request, last_message, chapters_text)
+        if not success:
+            yield error
+            return
 
-                yield fp.PartialResponse(text=self.GENERATING_CHAPTERS_TEXT)
-                
-                # Process video segments silently (no additional text)
-                video_url = user_data.get("processing_url")
-                if video_url:
-                    for chapter in res.chapters.root:
-                        segment_path = await self.extract_video_segment(
-                            video_url, 
-                            chapter.start, 
-                            chapter.end
-                        )
-                        if segment_path:
-                            try:
-                                # Just post the video segment without any additional text
-                                with open(segment_path, "rb") as f:
-                                    file_data = f.read()
-                                await self.post_message_attachment(
-                                    message_id=request.message_id,
-                                    file_data=file_data,
-                                    filename=f"chapter_{chapter.chapter_number + 1}.mp4"
-                                )
-                            finally:
-                                try:
-                                    os.unlink(segment_path)
-                                except Exception as e:
-                                    logger.error(f"Failed to clean up video segment: {e}")
-
-            elif "highlight" in last_message.lower():
-                res = self.client.generate.summarize(
-                    video_id=video_id,
-                    type="highlight"
-                )
-                
-                # First build the highlights text
-                highlights_text = "Here are the video highlights:\n\n"
-                for idx, highlight in enumerate(res.highlights.root, 1):
-                    timestamp = f"{highlight.start:.1f}s - {highlight.end:.1f}s"
-                    highlights_text += f"{idx}. {highlight.highlight} ({timestamp})\n"
-                
-                # Handle costs first
-                success, error = await self.handle_text_generation_costs(request, last_message, highlights_text)
-                if not success:
-                    yield error
-                    return
-                
-                yield fp.PartialResponse(text=highlights_text)
+        # Send the chapters text
+        yield fp.PartialResponse(text=chapters_text)
 
-                print(highlights_text)
-                time.sleep(0.1)
+        print(chapters_text)
 
-                yield fp.PartialResponse(text=self.GENERATING_HIGHLIGHTS_TEXT)
+        await asyncio.sleep(0)
 
-                time.sleep(0.1)
-                
-                # Process video segments silently (no additional text)
-                video_url = user_data.get("processing_url")
-                if video_url:
-                    for idx, highlight in enumerate(res.highlights.root, 1):
-                        segment_path = await self.extract_video_segment(
-                            video_url, 
-                            highlight.start, 
-                            highlight.end
-                        )
-                        if segment_path:
-                            try:
-                                # Just post the video segment without any additional text
-                                with open(segment_path, "rb") as f:
-                                    file_data = f.read()
-                                await self.post_message_attachment(
-                                    message_id=request.message_id,
-                                    file_data=file_data,
-                                    filename=f"highlight_{idx}.mp4"
-                                )
-                            finally:
-                                try:
-                                    os.unlink(segment_path)
-                                except Exception as e:
-                                    logger.error(f"Failed to clean up video segment: {e}")
-
-            elif "summarize" in last_message.lower() or "summary" in last_message.lower():
-                res = self.client.generate.summarize(
-                    video_id=video_id,
-                    type="summary"
-                )
-                print(res)
-                success, error = await self.handle_text_generation_costs(request, last_message, f"{res.summary}")
-                if not success:
-                    yield error
-                    return
-                response_text = f"{res.summary}"
+        yield _text_response(self.GENERATING_CHAPTERS_TEXT)
 
-                logger.info(f"Sending response: {response_text}")
-                yield fp.PartialResponse(
-                    text=response_text
-                )
+        # Process video segments silently (no additional text)
+        video_url = user_data.processing_url
+        if video_url:
+            await self.post_video_segments(request, video_url, [
+                (chapter.start, chapter.end, f"chapter_{chapter.chapter_number + 1}.mp4")
+                for chapter in res.chapters.root
+            ])
+
+    async def _handle_highlights(self, request, user_data, video_id, last_message):
+        """List the video highlights and post a clip of each highlight"""
+        res = await asyncio.to_thread(
+            self.client.generate.summarize,
+            video_id=video_id,
+            type="highlight"
+        )
 
-            else:
-                res = self.client.generate.text(
-                    video_id=video_id,
-                    prompt=last_message
-                )
-                success, error = await self.handle_text_generation_costs(request, last_message, f"{res.data}")
-                if not success:
-                    yield error
-                    return
-                response_text = f"{res.data}"
+        # First build the highlights text
+        parts = ["Here are the video highlights:\n\n"]
+        for idx, highlight in enumerate(res.highlights.root, 1):
+            parts.append(f"{idx}. {highlight.highlight} ({highlight.start:.1f}s - {highlight.end:.1f}s)\n")
+        highlights_text = "".join(parts)
+
+        # Handle costs first
+        success, error = await self.handle_text_generation_costs(request, last_message, highlights_text)
+        if not success:
+            yield error
+            return
+
+        yield fp.PartialResponse(text=highlights_text)
+
+        print(highlights_text)
+        await asyncio.sleep(0)
+
+        yield _text_response(self.GENERATING_HIGHLIGHTS_TEXT)
+
+        await asyncio.sleep(0)
+
+        # Process video segments silently (no additional text)
+        video_url = user_data.processing_url
+        if video_url:
+            await self.post_video_segments(request, video_url, [
+                (highlight.start, highlight.end, f"highlight_{idx}.mp4")
+                for idx, highlight in enumerate(res.highlights.root, 1)
+            ])
+
+    async def _handle_summary(self, request, user_data, video_id, last_message):
+        """Summarize the whole video"""
+        res = await asyncio.to_thread(
+            self.client.generate.summarize,
+            video_id=video_id,
+            type="summary"
+        )
+        print(res)
+        success, error = await self.handle_text_generation_costs(request, last_message, f"{res.summary}")
+        if not success:
+            yield error
+            return
+        response_text = f"{res.summary}"
+
+        logger.info(f"Sending response: {response_text}")
+        yield fp.PartialResponse(
+            text=response_text
+        )
+
+    async def _handle_freeform(self, request, user_data, video_id, last_message):
+        """Answer a free-form question about the video"""
+        res = await asyncio.to_thread(
+            self.client.generate.text,
+            video_id=video_id,
+            prompt=last_message
+        )
+        success, error = await self.handle_text_generation_costs(request, last_message, f"{res.data}")
+        if not success:
+            yield error
+            return
+        response_text = f"{res.data}"
+
+        logger.info(f"Sending response: {response_text}")
+        yield fp.PartialResponse(
+            text=response_text
+        )
+
+    async def _handle_new_video(self, request, user_data):
+        """Create a processing task for self.video_url and stream its progress to the user"""
+        try:
+            result = await self.create_pegasus_video_task(request.conversation_id, request)
             
+            if result == "insufficient_fund" or (isinstance(result, tuple) and result[0] == "error"):
+                if result == "insufficient_fund":
+                    yield fp.ErrorResponse(
+                        text=(
+                            "⚠️ Sorry, you don't have enough points to process this video.\n\n"
+                            "Please check the rate card above for video processing costs.\n\n"
+                            "💡 Tip: Videos under 1 minute are free! Try uploading a shorter clip."
+                        ),
+                        error_type="insufficient_fund"
+                    )
+                else:
+                    # Show our custom error message
+                    yield fp.PartialResponse(text=result[1])
+                # Clear any pending questions since we couldn't process the video
+                user_data = await self._load_user_data(request.conversation_id)
+                user_data.pending_question = None
+                await self._save_user_data(request.conversation_id, user_data)
+                return
             
-                logger.info(f"Sending response: {response_text}")
-                yield fp.PartialResponse(
-                    text=response_text
-                )
+            if result is not None:
+                # New video being processed, get the upload message with time estimate
+                user_data = await self._load_user_data(request.conversation_id)
+                upload_message = user_data.upload_message or "Video uploaded, processing started! This may take a few minutes..."
+                
+                logger.info(f"Sending response: {upload_message}")
+                yield fp.PartialResponse(text=upload_message)
+                await asyncio.sleep(1)
+            
+            # A None result means the video was already processed, continue with existing video_id
+            async for status in self.wait_for_processing(request.conversation_id, request):
+                yield status
+
+        except Exception as e:
+            logger.error(f"Error processing video: {e}")
+            response = self.PROCESSING_FAILED_MESSAGE
+            if user_data.video_id:
+                response += self.STILL_ASK_QUESTIONS_MESSAGE
+            yield fp.PartialResponse(text=response)
 
-            yield fp.PartialResponse(
-                text=""
+    async def post_video_segments(self, request, video_url, segments):
+        """Extract (start, end, filename) segments with one ffmpeg run and post them as attachments in order"""
+        try:
+            source = await self._local_source(video_url)
+        except Exception as e:
+            logger.warning(f"Failed to cache segment source, reading it over HTTP: {e}")
+            source = video_url
+        segment_data = await self.extract_video_segments(
+            source,
+            [(start, end) for start, end, _ in segments]
+        )
+        for file_data, (_, _, filename) in zip(segment_data, segments):
+            if not file_data:
+                continue
+            # Just post the video segment without any additional text
+            await self.post_message_attachment(
+                message_id=request.message_id,
+                file_data=file_data,
+                filename=filename
             )
-                    
+
+    @staticmethod
+    def _token_count(text):
+        """Approximate token count as the number of whitespace-separated words, without building a list"""
+        return sum(1 for _ in WORD_RE.finditer(text)) if text else 0
+
+    def _video_url_key(self, video_url):
+        """Key for a direct video URL in processed_videos"""
+        # Not a security boundary, so a fast non-cryptographic hash is enough; the builtin
+        # hash() can't be used because it is salted per process and the keys are persisted
+        return "url_" + xxhash.xxh64_hexdigest(video_url)
+
+    def _cached_download(self, url_key):
+        """
+        Take a kept download of this URL out of the cache and return (path, content hash), or None.
+        The caller owns the file until it deletes it or hands it back with _keep_download, so
+        concurrent requests for the same URL never share a file.
+        """
+        entry = self._download_cache.pop(url_key, None)
+        if entry is None:
+            return None
+        path, video_key, expires_ns = entry
+        if expires_ns < time.monotonic_ns() or not os.path.exists(path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return path, video_key
+
+    def _keep_download(self, url_key, path, video_key):
+        """Keep a download for a later retry, deleting the least recently used ones past the limit"""
+        if url_key in self._download_cache:
+            # Another request kept its own copy of the URL meanwhile; one is enough
+            self._drop_download(url_key)
+        self._download_cache[url_key] = (path, video_key, time.monotonic_ns() + DOWNLOAD_CACHE_TTL * 1_000_000_000)
+        self._download_cache.move_to_end(url_key)
+        while len(self._download_cache) > DOWNLOAD_CACHE_SIZE:
+            self._drop_download(next(iter(self._download_cache)))
+
+    def _drop_download(self, url_key):
+        """Forget a kept download and delete its file"""
+        path, _, _ = self._download_cache.pop(url_key)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
     def on_task_update(self,task):
         print(f"  Status={task.status}")
 
@@ -649,60 +852,59 @@ class TwelveLabsBot(fp.PoeBot):
     async def create_pegasus_video_task(self, conversation_id, request):
         logger.info(f"Creating video processing task for conversation: {conversation_id}")
         downloaded_path = None
-        processed_path = None
+        url_key = None
         
         try:
             # Load user data to check for previously processed videos
-            user_data = self._load_user_data(conversation_id)
-            processed_videos = user_data.get("processed_videos", {})
-
-            # For direct URLs, first check if we've processed this URL before
-            if not hasattr(self, 'video_name') and self.video_url in processed_videos:
-                video_key = processed_videos[self.video_url]
-                logger.info(f"URL already processed, reusing video_id: {video_key}")
-                user_data["video_id"] = video_key
-                user_data["processing_task"] = None
-                self._save_user_data(conversation_id, user_data)
-                return None  # Return None to indicate no new task needed
+            user_data = await self._load_user_data(conversation_id)
+            processed_videos = user_data.processed_videos
 
-            # For uploaded files or new URLs, we need to download to check the hash
-            downloaded_path = await self.download_video(self.video_url)
-            logger.info(f"Video downloaded to: {downloaded_path}")
+            # Direct URLs are keyed by URL as well, so repeat links skip the download (see get_response)
+            url_key = None if getattr(self, 'video_name', None) else self._video_url_key(self.video_url)
 
-            # Generate hash of the video content
-            with open(downloaded_path, 'rb') as f:
-                video_key = hashlib.md5(f.read()).hexdigest()
+            # For uploaded files or new URLs, we need to download to check the hash
+            # The content hash is computed while downloading
+            cached = self._cached_download(url_key) if url_key else None
+            if cached:
+                downloaded_path, video_key = cached
+                logger.info(f"Reusing earlier download: {downloaded_path}")
+            else:
+                downloaded_path, video_key = await self.download_video(self.video_url)
+                logger.info(f"Video downloaded to: {downloaded_path}")
+            
+            # Check if we've processed this video content before. Re-encodes of the same content
+            # hash differently, so on a miss fall back to a perceptual fingerprint match
+            video_id = processed_videos.get(video_key)
+            fingerprint = None
+            if video_id is None:
+                try:
+                    fingerprint = await self._video_fingerprint(downloaded_path)
+                except subprocess.CalledProcessError as e:
+                    logger.warning(f"Failed to fingerprint video: {e.stderr}")
+                if fingerprint:
+                    video_id = processed_videos.get(fingerprint) or self._find_similar_fingerprint(
+                        fingerprint, processed_videos
+                    )
             
-            # Check if we've processed this video content before
-            if video_key in processed_videos:
-                logger.info(f"Video content already processed, reusing video_id: {processed_videos[video_key]}")
-                user_data["video_id"] = processed_videos[video_key]
-                user_data["processing_task"] = None
-                # For URLs, store the URL mapping for future direct lookups
-                if not hasattr(self, 'video_name'):
-                    processed_videos[self.video_url] = video_key
-                self._save_user_data(conversation_id, user_data)
+            if video_id is not None:
+                logger.info(f"Video content already processed, reusing video_id: {video_id}")
+                user_data.video_id = video_id
+                user_data.processing_task = None
+                user_data.processing_url = self.video_url
+                duration_seconds = (await self._probe(downloaded_path))[0]
+                user_data.duration_minutes = duration_seconds / 60
+                # Store the exact hash (and for URLs, the URL) for future direct lookups
+                processed_videos[video_key] = video_id
+                if url_key:
+                    processed_videos[url_key] = video_id
+                await self._save_user_data(conversation_id, user_data)
                 return None  # Return None to indicate no new task needed
 
             # If we get here, it's a new video. Calculate costs and proceed with processing
             try:
-                duration_command = [
-                    'ffprobe',
-                    '-v', 'error',
-                    '-show_entries', 'format=duration',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    downloaded_path
-                ]
-                
-                duration_result = subprocess.run(
-                    duration_command,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-
-                duration_minutes = float(duration_result.stdout) / 60
-                duration_seconds = float(duration_result.stdout)
+                probe = await self._probe(downloaded_path)
+                duration_seconds = probe[0]
+                duration_minutes = duration_seconds / 60
                 
                 # Calculate estimated processing time (15% of duration, rounded up to nearest minute)
                 processing_minutes = math.ceil(duration_seconds * 0.15 / 60)
@@ -711,20 +913,17 @@ class TwelveLabsBot(fp.PoeBot):
                 # Create upload message with time estimate
                 upload_message = f"Video uploaded, processing started! This should take about {processing_time_str} to complete..."
                 
-                # Save to user data for use in get_response
-                user_data = self._load_user_data(conversation_id)
-                user_data["upload_message"] = upload_message
-                self._save_user_data(conversation_id, user_data)
+                # Saved with the task below for use in get_response
                 
                 # Validate video duration
                 if duration_seconds < MIN_VIDEO_DURATION:
                     error_msg = self.VIDEO_TOO_SHORT_MESSAGE
-                    if user_data.get("video_id"):
+                    if user_data.video_id:
                         error_msg += self.STILL_ASK_QUESTIONS_MESSAGE
                     return ("error", error_msg)
                 if duration_seconds > MAX_VIDEO_DURATION:
                     error_msg = self.VIDEO_TOO_LONG_MESSAGE
-                    if user_data.get("video_id"):
+                    if user_data.video_id:
                         error_msg += self.STILL_ASK_QUESTIONS_MESSAGE
                     return ("error", error_msg)
                 
@@ -749,85 +948,65 @@ class TwelveLabsBot(fp.PoeBot):
                 logger.info(f"Total cost: {visual_indexing_cost + audio_indexing_cost + storage_cost} millicents")
 
                 costs = [
-                    fp.CostItem(
-                        amount_usd_milli_cents=visual_indexing_cost,
-                        description="Visual indexing"
-                    ),
-                    fp.CostItem(
-                        amount_usd_milli_cents=audio_indexing_cost,
-                        description="Audio indexing"
-                    ),
-                    fp.CostItem(
-                        amount_usd_milli_cents=storage_cost,
-                        description="Monthly storage"
-                    )
+                    _cost_item(visual_indexing_cost, "Visual indexing"),
+                    _cost_item(audio_indexing_cost, "Audio indexing"),
+                    _cost_item(storage_cost, "Monthly storage")
                 ]
 
-                # Authorize costs before downloading or processing
-                try:
-                    await self.authorize_cost(request, costs)
-                except fp.InsufficientFundError:
-                    logger.error("Insufficient funds for video processing")
-                    return ("error", self.INSUFFICIENT_FUNDS_MESSAGE)
+                # Authorize costs before processing; free videos skip both billing round-trips
+                is_free = not (visual_indexing_cost or audio_indexing_cost or storage_cost)
+                if not is_free:
+                    try:
+                        await self.authorize_cost(request, costs)
+                    except fp.InsufficientFundError:
+                        logger.error("Insufficient funds for video processing")
+                        return ("error", self.INSUFFICIENT_FUNDS_MESSAGE)
 
-                # Load user data and create index if needed
-                user_data = self._load_user_data(conversation_id)
-                index_id = user_data.get("index_id")
+                # Create index if needed. It doesn't depend on the processed video,
+                # so the API call overlaps with the upscale
+                index_id = user_data.index_id
 
                 if index_id is None:
-                    models = [
-                        {
-                            "type": "visual",
-                            "name": "pegasus1.2",
-                            "options": ["visual"]
-                        }
-                    ]
-                    index_name = "poe_index_" + str(int(time.time()))
-                    try:
-                        index = self.client.index.create(
-                            name=index_name,
-                            models=models
-                        )
-                        index_id = index.id
-                        user_data["index_id"] = index_id
-                        self._save_user_data(conversation_id, user_data)
-                    except twelvelabs.exceptions.TwelveLabsError as e:
-                        logger.error(f"Failed to create index: {e}")
-                        raise
-
-                # Now proceed with downloading and processing
-                processed_path = await self.upscale_video(downloaded_path)
-                logger.info(f"Video processed and upscaled to: {processed_path}")
+                    results = await asyncio.gather(
+                        self._create_index(conversation_id, user_data),
+                        self.upscale_video(downloaded_path, probe=probe, in_memory=True),
+                        return_exceptions=True
+                    )
+                    for result in results:
+                        if isinstance(result, BaseException):
+                            raise result
+                    index_id, processed = results
+                else:
+                    processed = await self.upscale_video(downloaded_path, probe=probe, in_memory=True)
                 
-                try:
-                    # Create task with processed video
-                    with open(processed_path, 'rb') as video_file:
-                        task = self.client.task.create(
-                            index_id=index_id,
-                            file=video_file
-                        )
-                    
-                    logger.info(f"Created task: id={task.id} status={task.status}")
-                    user_data["processing_task"] = task.id
-                    user_data["processing_url"] = self.video_url
-                    
-                    # Store both the hash and video_id mapping
-                    user_data["processed_videos"][video_key] = task.video_id
-                    self._save_user_data(conversation_id, user_data)
-                    
-                    # Capture the actual cost after successful processing
+                # Create task with the upscaled buffer, or the download when no upscaling was needed
+                video_file = open(processed, 'rb') if isinstance(processed, str) else processed
+                with video_file:
+                    task = await asyncio.to_thread(
+                        self.client.task.create,
+                        index_id=index_id,
+                        file=video_file
+                    )
+                
+                logger.info(f"Created task: id={task.id} status={task.status}")
+                user_data.upload_message = upload_message
+                user_data.processing_task = task.id
+                user_data.processing_url = self.video_url
+                user_data.duration_minutes = duration_minutes
+                
+                # Store both the hash and video_id mapping
+                processed_videos[video_key] = task.video_id
+                if fingerprint:
+                    processed_videos[fingerprint] = task.video_id
+                if url_key:
+                    processed_videos[url_key] = task.video_id
+                await self._save_user_data(conversation_id, user_data)
+                
+                # Capture the actual cost after successful processing
+                if not is_free:
                     await self.capture_cost(request, costs)
-                    
-                    return task.id
-                    
-                finally:
-                    # Clean up processed video
-                    if processed_path and os.path.exists(processed_path):
-                        try:
-                            os.unlink(processed_path)
-                            logger.debug(f"Cleaned up processed video: {processed_path}")
-                        except Exception as e:
-                            logger.error(f"Failed to clean up processed video: {e}")
+                
+                return task.id
 
             except VideoDurationError as e:
                 if str(e) == 'video_duration_too_short':
@@ -840,7 +1019,16 @@ class TwelveLabsBot(fp.PoeBot):
                 raise
 
         finally:
-            # Clean up downloaded video in all cases
+            # Keep the download of a URL that wasn't processed (e.g. insufficient funds) for a
+            # retry; once the URL is in processed_videos it is never downloaded again
+            if downloaded_path and url_key and url_key not in processed_videos:
+                self._keep_download(url_key, downloaded_path, video_key)
+                downloaded_path = None
+            elif url_key in self._download_cache:
+                # Processed now, so a copy kept by an earlier request is no longer needed; kept
+                # copies are never in use, _cached_download takes them out of the cache
+                self._drop_download(url_key)
+            # Clean up this call's own download in all other cases
             if downloaded_path and os.path.exists(downloaded_path):
                 try:
                     os.unlink(downloaded_path)
@@ -848,201 +1036,164 @@ class TwelveLabsBot(fp.PoeBot):
                 except Exception as e:
                     logger.error(f"Failed to clean up downloaded video: {e}")
 
+    async def _create_index(self, conversation_id, user_data):
+        """Create the Pegasus index for a conversation and save its id right away"""
+        models = [
+            {
+                "type": "visual",
+                "name": "pegasus1.2",
+                "options": ["visual"]
+            }
+        ]
+        index_name = "poe_index_" + str(int(time.time()))
+        try:
+            index = await asyncio.to_thread(
+                self.client.index.create,
+                name=index_name,
+                models=models
+            )
+        except twelvelabs.exceptions.TwelveLabsError as e:
+            logger.error(f"Failed to create index: {e}")
+            raise
+        user_data.index_id = index.id
+        await self._save_user_data(conversation_id, user_data)
+        return index.id
+
     async def wait_for_processing(self, conversation_id, request):
         logger.info(f"Waiting for processing to complete for conversation: {conversation_id}")
-        user_data = self._load_user_data(conversation_id)
-        task_id = user_data.get("processing_task")
+        user_data = await self._load_user_data(conversation_id)
+        task_id = user_data.processing_task
         
         if not task_id:
             # Check if we have a video_id (meaning we're reusing a processed video)
-            if user_data.get("video_id"):
+            if user_data.video_id:
                 # Only process pending questions if this is a reused video, not a failed upload
-                if user_data.get("processing_task") is None:  # Explicitly None means reused video
-                    # Check for pending question
-                    pending_question = user_data.get("pending_question")
+                if user_data.processing_task is None:  # Explicitly None means reused video
+                    pending_question = user_data.pending_question
                     if pending_question:
                         logger.info(f"Found pending question for existing video: {pending_question}")
                         # Clear pending question first in case of insufficient funds
-                        user_data["pending_question"] = None
-                        self._save_user_data(conversation_id, user_data)
-                        
-                        # Calculate and authorize input costs first
-                        input_tokens = len(pending_question.split())
-                        input_cost = math.ceil(input_tokens * TWELVE_LABS_INPUT_TOKEN_COST)
-                        
-                        logger.info(f"Input tokens: {input_tokens}")
-                        logger.info(f"Input cost: {input_cost} millicents")
-                        
-                        try:
-                            # Authorize input cost first
-                            await self.authorize_cost(
-                                request,
-                                [
-                                    fp.CostItem(
-                                        amount_usd_milli_cents=input_cost,
-                                        description="Text generation input"
-                                    ),
-                                    fp.CostItem(
-                                        amount_usd_milli_cents=math.ceil(OUTPUT_TEXT_TOKEN_ASSUMPTION * TWELVE_LABS_OUTPUT_TOKEN_COST),
-                                        description="Text generation output"
-                                    )
-                                ]
-                            )
-                            
-                            # Process the pending question
-                            res = self.client.generate.text(
-                                video_id=user_data["video_id"],
-                                prompt=pending_question
-                            )
-                            response_text = self.PENDING_QUESTION_RESPONSE.format(
-                                question=pending_question,
-                                answer=res.data
-                            )
-                            
-                            # Calculate and capture both input and output costs
-                            output_tokens = len(res.data.split())
-                            output_cost = math.ceil(output_tokens * TWELVE_LABS_OUTPUT_TOKEN_COST)
-                            
-                            logger.info(f"Output tokens: {output_tokens}")
-                            logger.info(f"Output cost: {output_cost} millicents")
-                            logger.info(f"Total text generation cost: {input_cost + output_cost} millicents")
-                            
-                            costs = [
-                                fp.CostItem(
-                                    amount_usd_milli_cents=input_cost,
-                                    description="Text generation input"
-                                ),
-                                fp.CostItem(
-                                    amount_usd_milli_cents=output_cost,
-                                    description="Text generation output"
-                                )
-                            ]
-                            
-                            await self.capture_cost(request, costs)
-                            yield fp.PartialResponse(text=response_text)
-                            return
-                            
-                        except fp.InsufficientFundError:
-                            yield fp.PartialResponse(text=self.INSUFFICIENT_FUNDS_MESSAGE)
-                            return
+                        user_data.pending_question = None
+                        await self._save_user_data(conversation_id, user_data)
                     
-                    # Show completion message if no pending question
-                    yield fp.PartialResponse(text=self.PROCESSING_COMPLETE_MESSAGE)
+                    async for response in self._answer_pending(request, user_data.video_id, pending_question):
+                        yield response
                     return
                 
-            yield fp.PartialResponse(text=self.NO_TASK_MESSAGE)
+            yield _text_response(self.NO_TASK_MESSAGE)
             return
 
-        # Check task status with timeout
-        start_time = time.time()
-        last_update = start_time
+        # Check task status with timeout. Polling backs off in the background while
+        # the response keeps streaming a dot every HEARTBEAT_INTERVAL seconds
         timeout = 600 - 5  # 10 minutes timeout, 5 second buffer
-        
-        while True:
-            current_time = time.time()
-            # Send a dot every 3 seconds
-            if current_time - last_update >= 3:
+        poll = asyncio.create_task(self._poll_task(task_id, timeout))
+        try:
+            while True:
+                done, _ = await asyncio.wait({poll}, timeout=HEARTBEAT_INTERVAL)
+                if done:
+                    break
                 yield fp.PartialResponse(text=".")
-                last_update = current_time
+        finally:
+            poll.cancel()
+        task = poll.result()
+        
+        if task is None:
+            logger.warning(f"Task {task_id} timed out after {timeout} seconds")
+            # Save task ID to allow checking status later
+            user_data.processing_task = task_id
+            await self._save_user_data(conversation_id, user_data)
+            yield fp.PartialResponse(text="timeout")
+            return
+        
+        if task.status == "ready":
+            # Save video_id to user data, clearing the processing task and any pending
+            # question in the same write
+            pending_question = user_data.pending_question
+            user_data.video_id = task.video_id
+            user_data.processing_task = None
+            user_data.pending_question = None
+            await self._save_user_data(conversation_id, user_data)
             
-            if current_time - start_time > timeout:
-                logger.warning(f"Task {task_id} timed out after {timeout} seconds")
-                # Save task ID to allow checking status later
-                user_data["processing_task"] = task_id
-                self._save_user_data(conversation_id, user_data)
-                yield fp.PartialResponse(text="timeout")
-                return
+            if pending_question:
+                logger.info(f"Found pending question: {pending_question}")
             
-            # Retrieve latest task status
-            task = self.client.task.retrieve(task_id)
+            async for response in self._answer_pending(request, user_data.video_id, pending_question):
+                yield response
+            return
+        else:
+            logger.error(f"Task {task_id} failed")
+            yield _text_response(self.PROCESSING_FAILED_MESSAGE)
+            return
+
+    async def _answer_pending(self, request, video_id, pending_question):
+        """Answer a question asked before the video was ready, or report that processing is complete"""
+        if not pending_question:
+            yield _text_response(self.PROCESSING_COMPLETE_MESSAGE)
+            return
+        
+        # Calculate and authorize input costs first
+        input_tokens = self._token_count(pending_question)
+        input_cost = math.ceil(input_tokens * TWELVE_LABS_INPUT_TOKEN_COST)
+        input_cost_item = _cost_item(input_cost, "Text generation input")
+        
+        logger.info(f"Input tokens: {input_tokens}")
+        logger.info(f"Input cost: {input_cost} millicents")
+        
+        try:
+            await self.authorize_cost(
+                request,
+                [
+                    input_cost_item,
+                    _cost_item(math.ceil(OUTPUT_TEXT_TOKEN_ASSUMPTION * TWELVE_LABS_OUTPUT_TOKEN_COST), "Text generation output")
+                ]
+            )
             
-            # Replace print statements with logging
-            logger.debug(f"Task {task_id} status: {task.status}")
+            # Process the pending question
+            res = await asyncio.to_thread(
+                self.client.generate.text,
+                video_id=video_id,
+                prompt=pending_question
+            )
+            response_text = self.PENDING_QUESTION_RESPONSE.format(
+                question=pending_question,
+                answer=res.data
+            )
             
-            # Check task status directly
-            if task.status == "ready":
-                # Save video_id to user data
-                user_data["video_id"] = task.video_id
-                user_data["processing_task"] = None  # Clear processing task
-                self._save_user_data(conversation_id, user_data)
-                
-                # Check for pending question
-                pending_question = user_data.get("pending_question")
-                if pending_question:
-                    logger.info(f"Found pending question: {pending_question}")
-                    # Clear pending question
-                    user_data["pending_question"] = None
-                    self._save_user_data(conversation_id, user_data)
-                    
-                    # Calculate and authorize input costs first
-                    input_tokens = len(pending_question.split())
-                    input_cost = math.ceil(input_tokens * TWELVE_LABS_INPUT_TOKEN_COST)
-                    
-                    logger.info(f"Input tokens: {input_tokens}")
-                    logger.info(f"Input cost: {input_cost} millicents")
-                    
-                    try:
-                        # Authorize input cost first
-                        await self.authorize_cost(
-                            request,
-                            [
-                                fp.CostItem(
-                                    amount_usd_milli_cents=input_cost,
-                                    description="Text generation input"
-                                ),
-                                fp.CostItem(
-                                    amount_usd_milli_cents=math.ceil(OUTPUT_TEXT_TOKEN_ASSUMPTION * TWELVE_LABS_OUTPUT_TOKEN_COST),
-                                    description="Text generation output"
-                                )
-                            ]
-                        )
-                        
-                        # Process the pending question
-                        res = self.client.generate.text(
-                            video_id=user_data["video_id"],
-                            prompt=pending_question
-                        )
-                        response_text = self.PENDING_QUESTION_RESPONSE.format(
-                            question=pending_question,
-                            answer=res.data
-                        )
-                        
-                        # Calculate and capture both input and output costs
-                        output_tokens = len(res.data.split())
-                        output_cost = math.ceil(output_tokens * TWELVE_LABS_OUTPUT_TOKEN_COST)
-                        
-                        logger.info(f"Output tokens: {output_tokens}")
-                        logger.info(f"Output cost: {output_cost} millicents")
-                        logger.info(f"Total text generation cost: {input_cost + output_cost} millicents")
-                        
-                        costs = [
-                            fp.CostItem(
-                                amount_usd_milli_cents=input_cost,
-                                description="Text generation input"
-                            ),
-                            fp.CostItem(
-                                amount_usd_milli_cents=output_cost,
-                                description="Text generation output"
-                            )
-                        ]
-                        
-                        await self.capture_cost(request, costs)
-                        yield fp.PartialResponse(text=response_text)
-                        return
-                        
-                    except fp.InsufficientFundError:
-                        yield fp.PartialResponse(text=self.INSUFFICIENT_FUNDS_MESSAGE)
-                        return
-                    
-                # Show completion message if no pending question
-                yield fp.PartialResponse(text=self.PROCESSING_COMPLETE_MESSAGE)
-                return
-            elif task.status == "failed":
-                logger.error(f"Task {task_id} failed")
-                yield fp.PartialResponse(text=self.PROCESSING_FAILED_MESSAGE)
-                return
+            # Calculate and capture both input and output costs
+            output_tokens = self._token_count(res.data)
+            output_cost = math.ceil(output_tokens * TWELVE_LABS_OUTPUT_TOKEN_COST)
             
-            await asyncio.sleep(2)
+            logger.info(f"Output tokens: {output_tokens}")
+            logger.info(f"Output cost: {output_cost} millicents")
+            logger.info(f"Total text generation cost: {input_cost + output_cost} millicents")
+            
+            await self.capture_cost(
+                request,
+                [
+                    input_cost_item,
+                    _cost_item(output_cost, "Text generation output")
+                ]
+            )
+            yield fp.PartialResponse(text=response_text)
+            
+        except fp.InsufficientFundError:
+            yield _text_response(self.INSUFFICIENT_FUNDS_MESSAGE)
+
+    async def _poll_task(self, task_id, timeout):
+        """Poll a task with exponential backoff until it is ready or failed; None on timeout"""
+        deadline_ns = time.monotonic_ns() + timeout * 1_000_000_000
+        delay = TASK_POLL_INITIAL_DELAY
+        while True:
+            task = await asyncio.to_thread(self.client.task.retrieve, task_id)
+            logger.debug(f"Task {task_id} status: {task.status}")
+            if task.status in ("ready", "failed"):
+                return task
+            
+            remaining_ns = deadline_ns - time.monotonic_ns()
+            if remaining_ns <= 0:
+                return None
+            await asyncio.sleep(min(delay, remaining_ns / 1e9))
+            delay = min(delay * TASK_POLL_BACKOFF, TASK_POLL_MAX_DELAY)
 
     def _get_extension_from_url(self, url):
         """Extract extension from URL or default to .mp4"""
@@ -1054,54 +1205,244 @@ class TwelveLabsBot(fp.PoeBot):
         ext = mimetypes.guess_extension(mimetype)
         return ext if ext else '.mp4'
 
-    async def download_video(self, url_or_attachment):
+    async def download_video(self, url_or_attachment, directory=None):
         """
-        Downloads video from either a URL or attachment.
+        Downloads video from either a URL or attachment into directory (default: the temp dir).
         Preserves original file extension.
+        The content is hashed while it streams to disk; returns (path, XXH3-128 hex digest).
         """
         if isinstance(url_or_attachment, str):  # URL
-            extension = self._get_extension_from_url(url_or_attachment)
+            url = url_or_attachment
+            extension = self._get_extension_from_url(url)
         else:  # Attachment
+            url = url_or_attachment.url
             extension = self._get_extension_from_mimetype(url_or_attachment.content_type)
 
-        with NamedTemporaryFile(suffix=extension, delete=False) as temp_file:
-            if isinstance(url_or_attachment, str):  # URL
+        # Stream the body in fixed-size chunks so memory stays flat regardless of video size
+        video_hash = xxhash.xxh3_128()
+        with NamedTemporaryFile(suffix=extension, dir=directory, delete=False) as temp_file:
+            try:
                 async with aiohttp.ClientSession() as session:
-                    async with session.get(url_or_attachment) as response:
+                    async with session.get(url) as response:
                         if response.status != 200:
                             raise Exception(f"Failed to download video: HTTP {response.status}")
-                        temp_file.write(await response.read())
-            else:  # Attachment
-                response = await self.client.session.get(url_or_attachment.url)
-                temp_file.write(await response.read())
+                        async for chunk in response.content.iter_chunked(HASH_CHUNK_SIZE):
+                            video_hash.update(chunk)
+                            temp_file.write(chunk)
+            except BaseException:
+                # Don't leave a partial download behind, it may be on the persistent volume
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
             
             temp_file.flush()
-            return temp_file.name
+            return temp_file.name, video_hash.hexdigest()
 
-    async def upscale_video(self, input_path, target_width=854, target_height=480):
+    async def _local_source(self, video_url):
         """
-        Validates video length and upscales video file to the target dimensions using FFmpeg.
-        Converts to MP4 (H.264) format for maximum compatibility.
+        Return a local copy of video_url on the storage volume, downloading it on first use.
+        The least recently used copies are deleted once they exceed SOURCE_CACHE_MAX_BYTES.
         """
-        logger.info(f"Processing video from: {input_path}")
+        path = self.sources_dir / (xxhash.xxh3_64_hexdigest(video_url) + self._get_extension_from_url(video_url))
+        if path.exists():
+            os.utime(path)  # Mark as recently used for eviction
+            return str(path)
         
-        # Check video duration using ffprobe
-        duration_command = [
+        # Download next to the cache, not in it, so eviction never sees a file still being written;
+        # the rename into place is atomic since both are on the same volume
+        downloaded_path, _ = await self.download_video(video_url, directory=self.partial_sources_dir)
+        os.replace(downloaded_path, path)
+        await asyncio.to_thread(self._evict_sources)
+        return str(path)
+
+    def _evict_sources(self):
+        """Delete the least recently used finished source copies beyond SOURCE_CACHE_MAX_BYTES"""
+        entries = []
+        for entry in os.scandir(self.sources_dir):
+            if not SOURCE_NAME_RE.match(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Evicted by another request meanwhile
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= SOURCE_CACHE_MAX_BYTES:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        
+        # Partial downloads of containers that died mid-download; writing keeps an active
+        # download's mtime fresh, so only abandoned ones are this old
+        stale_before = time.time() - DOWNLOAD_CACHE_TTL
+        for entry in os.scandir(self.partial_sources_dir):
+            try:
+                if entry.stat().st_mtime < stale_before:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    async def _run(self, command, text=True):
+        """
+        Run an ffmpeg/ffprobe command without blocking the event loop.
+        Returns its stdout (raw bytes when text is False), raising CalledProcessError on a
+        non-zero exit like subprocess.run(check=True).
+        """
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.gather(process.stdout.read(), self._stderr_tail(process.stderr))
+            await process.wait()
+        except asyncio.CancelledError:
+            # Don't leave ffmpeg running when the request that started it goes away
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, command, stdout.decode(errors='replace'), stderr
+            )
+        return stdout.decode() if text else stdout
+
+    @staticmethod
+    async def _stderr_tail(stream):
+        """Drain a subprocess's stderr while it runs, keeping only the last STDERR_TAIL_LINES lines"""
+        tail = deque(maxlen=STDERR_TAIL_LINES)
+        partial = b''
+        while chunk := await stream.read(PIPE_READ_SIZE):
+            # Progress lines end in \r, so split on both line endings
+            lines = (partial + chunk).replace(b'\r', b'\n').split(b'\n')
+            partial = lines.pop()
+            tail.extend(lines)
+        tail.append(partial)
+        return b'\n'.join(line for line in tail if line).decode(errors='replace')
+
+    async def _probe(self, path):
+        """
+        Return (duration_seconds, width, height, audio_codec) of a video with a single ffprobe call.
+        audio_codec is None when the video has no audio stream.
+        """
+        probe_command = [
             'ffprobe',
             '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            input_path
+            '-show_entries', 'format=duration:stream=codec_type,codec_name,width,height',
+            '-of', 'json',
+            path
         ]
+        info = msgspec.json.decode(await self._run(probe_command))
+        video = next(stream for stream in info["streams"] if stream.get("codec_type") == "video")
+        audio = next((stream for stream in info["streams"] if stream.get("codec_type") == "audio"), None)
+        return (
+            float(info["format"]["duration"]),
+            int(video["width"]),
+            int(video["height"]),
+            audio["codec_name"] if audio else None
+        )
+
+    async def _video_fingerprint(self, path):
+        """
+        Return a perceptual fingerprint of a video that survives re-encoding and re-muxing.
+        Keyframes are sampled at 1 fps as 8x8 grayscale thumbnails and the fingerprint is the
+        64-bit average hashes of FINGERPRINT_SAMPLES of them, spread evenly over the
+        video and prefixed with the frame count. Returns None for videos too short to match.
+        """
+        command = [
+            'ffmpeg',
+            '-v', 'error',
+            '-skip_frame', 'nokey',  # Decode keyframes only
+            '-i', path,
+            '-vf', f'fps=1,scale={FINGERPRINT_SIZE}:{FINGERPRINT_SIZE},format=gray',
+            '-f', 'rawvideo',
+            '-'
+        ]
+        pixels = await self._run(command, text=False)
+        frames = len(pixels) // (FINGERPRINT_SIZE * FINGERPRINT_SIZE)
+        if frames < FINGERPRINT_MIN_FRAMES:
+            return None
+        hashes = await asyncio.to_thread(self._frame_hashes, pixels, frames)
+        return f"fp_{frames}_" + "".join(f"{frame_hash:016x}" for frame_hash in hashes)
+
+    @staticmethod
+    def _frame_hashes(pixels, frames):
+        """Average hashes of FINGERPRINT_SAMPLES evenly spaced 8x8 frames of raw grayscale pixels"""
+        frame_size = FINGERPRINT_SIZE * FINGERPRINT_SIZE
+        hashes = []
+        # Always FINGERPRINT_SAMPLES hashes (short videos repeat frames), so fingerprints of
+        # videos a frame apart in length still line up sample by sample
+        for sample in range(FINGERPRINT_SAMPLES):
+            start = sample * frames // FINGERPRINT_SAMPLES * frame_size
+            frame = pixels[start:start + frame_size]
+            mean = sum(frame) / frame_size
+            hashes.append(sum(1 << bit for bit, value in enumerate(frame) if value > mean))
+        return hashes
+
+    @staticmethod
+    def _find_similar_fingerprint(fingerprint, processed_videos):
+        """
+        Return the video_id of a stored fingerprint of the same length whose frame hashes are
+        within FINGERPRINT_MAX_DISTANCE bits for at least FINGERPRINT_MIN_MATCH of the samples
+        """
+        _, frames, value = fingerprint.split("_")
+        frames = int(frames)
+        hashes = [int(value[i:i + 16], 16) for i in range(0, len(value), 16)]
+        needed = math.ceil(len(hashes) * FINGERPRINT_MIN_MATCH)
+        for key, video_id in processed_videos.items():
+            if not key.startswith("fp_"):
+                continue
+            _, other_frames, other_value = key.split("_")
+            # Same sample count also rules out the single-hash fingerprints stored before
+            if abs(int(other_frames) - frames) > 1 or len(other_value) != len(value):
+                continue
+            matches = sum(
+                bin(int(other_value[i:i + 16], 16) ^ frame_hash).count("1") <= FINGERPRINT_MAX_DISTANCE
+                for i, frame_hash in zip(range(0, len(other_value), 16), hashes)
+            )
+            if matches >= needed:
+                return video_id
+        return None
+
+    async def _h264_encoder(self):
+        """
+        Pick the fastest H.264 encoder that works on this host, checked once per process.
+        Hardware encoders are only used if a tiny test encode succeeds, since ffmpeg
+        builds list them even when the GPU or driver is missing.
+        """
+        if TwelveLabsBot._h264_encoder_name is None:
+            TwelveLabsBot._h264_encoder_name = 'libx264'
+            for encoder in HW_H264_ENCODERS:
+                try:
+                    await self._run([
+                        'ffmpeg', '-hide_banner', '-v', 'error',
+                        '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+                        '-c:v', encoder, '-f', 'null', '-'
+                    ])
+                except (subprocess.CalledProcessError, OSError):
+                    continue
+                TwelveLabsBot._h264_encoder_name = encoder
+                break
+            logger.info(f"Using H.264 encoder: {TwelveLabsBot._h264_encoder_name}")
+        return TwelveLabsBot._h264_encoder_name
+
+    async def upscale_video(self, input_path, target_width=854, target_height=480, probe=None, in_memory=False):
+        """
+        Validates video length and upscales video file to the target dimensions using FFmpeg.
+        Converts to MP4 (H.264) format for maximum compatibility.
+        probe is an optional (duration, width, height, audio_codec) from _probe, to skip probing again.
+        With in_memory, an upscaled video is piped from ffmpeg into a BytesIO instead of a temp file.
+        Returns input_path unchanged if no upscaling is needed.
+        """
+        logger.info(f"Processing video from: {input_path}")
         
         try:
-            duration_result = subprocess.run(
-                duration_command,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            duration = float(duration_result.stdout)
+            duration, width, height, audio_codec = probe or await self._probe(input_path)
             
             # Validate duration
             if duration < MIN_VIDEO_DURATION:
@@ -1109,24 +1450,6 @@ class TwelveLabsBot(fp.PoeBot):
             if duration > MAX_VIDEO_DURATION:
                 raise VideoDurationError('video_duration_too_long')
             
-            # Check video resolution using ffprobe
-            resolution_command = [
-                'ffprobe',
-                '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height',
-                '-of', 'csv=s=x:p=0',
-                input_path
-            ]
-            
-            resolution_result = subprocess.run(
-                resolution_command,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            width, height = map(int, resolution_result.stdout.split('x'))
-            
             # Check if the video needs upscaling
             if (width >= 480 and height >= 360) or (width >= 360 and height >= 480):
                 logger.info("Video resolution is sufficient, no upscaling needed.")
@@ -1136,32 +1459,41 @@ class TwelveLabsBot(fp.PoeBot):
             logger.error(f"Failed to get video properties: {e.stderr}")
             raise Exception(f"Video property check failed: {e.stderr}")
         
+        encoder = await self._h264_encoder()
+        if in_memory:
+            ffmpeg_command = [
+                'ffmpeg',
+                *FFMPEG_QUIET_ARGS,
+                '-filter_threads', str(FFMPEG_THREADS // 2 or 1), # Scaling and decoding get the other half
+                '-threads', str(FFMPEG_THREADS // 2 or 1),
+                '-i', input_path,
+                *_upscale_output_args(target_width, target_height, encoder, audio_codec == 'aac', True),
+                'pipe:1'
+            ]
+            try:
+                output = io.BytesIO(await self._run(ffmpeg_command, text=False))
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Failed to process video: {e.stderr}")
+                raise Exception(f"Video processing failed: {e.stderr}")
+            output.name = "video.mp4"  # The SDK uses the name for the upload's filename
+            logger.info(f"Video processed successfully")
+            return output
+        
         with NamedTemporaryFile(suffix='.mp4', delete=False) as output_file:
             # Enhanced FFmpeg command with better compatibility
             ffmpeg_command = [
                 'ffmpeg',
-                '-ss', str(start_time),  # Move -ss before -i for faster seeking
-                '-i', video_url,
-                '-t', str(end_time - start_time),
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',  # Fastest encoding preset
-                '-tune', 'fastdecode',   # Optimize for fast decoding
-                '-profile:v', 'baseline', # Simpler profile for faster encoding
-                '-level', '3.0',         # Compatible level for mobile/web
-                '-movflags', '+faststart', # Optimize for web playback
-                '-c:a', 'aac',
-                '-b:a', '128k',          # Reasonable audio quality
+                *FFMPEG_QUIET_ARGS,
+                '-filter_threads', str(FFMPEG_THREADS // 2 or 1), # Scaling and decoding get the other half
+                '-threads', str(FFMPEG_THREADS // 2 or 1),
+                '-i', input_path,        # Read the local download, the whole video is upscaled
+                *_upscale_output_args(target_width, target_height, encoder, audio_codec == 'aac'),
                 '-y',
                 output_file.name
             ]
             
             try:
-                result = subprocess.run(
-                    ffmpeg_command,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
+                await self._run(ffmpeg_command)
                 logger.info(f"Video processed successfully")
                 return output_file.name
             except subprocess.CalledProcessError as e:
@@ -1170,33 +1502,25 @@ class TwelveLabsBot(fp.PoeBot):
 
     async def handle_text_generation_costs(self, request, input_text, output_text):
         """
-        Calculate, log, authorize and capture costs for text generation.
+        Calculate, log and capture costs for text generation.
         Free for videos under FREE_VIDEO_DURATION_MINUTES.
+        The text has already been generated, so the exact cost is captured directly
+        without a separate authorize round-trip.
         """
         # Load user data to check video duration
-        user_data = self._load_user_data(request.conversation_id)
-        video_url = user_data.get("processing_url")
+        user_data = await self._load_user_data(request.conversation_id)
+        duration_minutes = user_data.duration_minutes
+        video_url = user_data.processing_url
         
         logger.info(f"Processing URL from user_data: {video_url}")
         
-        if video_url:
-            # Get video duration
-            duration_command = [
-                'ffprobe',
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                video_url
-            ]
-            
-            duration_result = subprocess.run(
-                duration_command,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            duration_minutes = float(duration_result.stdout) / 60
-            
+        if duration_minutes is None and video_url:
+            # Duration wasn't recorded when the video was processed, probe the source once
+            duration_minutes = (await self._probe(video_url))[0] / 60
+            user_data.duration_minutes = duration_minutes
+            await self._save_user_data(request.conversation_id, user_data)
+        
+        if duration_minutes is not None:
             # If video is under FREE_VIDEO_DURATION_MINUTES, make it free
             if duration_minutes < FREE_VIDEO_DURATION_MINUTES:
                 logger.info(f"Video duration ({duration_minutes:.2f} minutes) is under {FREE_VIDEO_DURATION_MINUTES} minute - no charge")
@@ -1205,28 +1529,14 @@ class TwelveLabsBot(fp.PoeBot):
             logger.warning(f"No processing_url found in user_data: {user_data}")
 
         # Regular cost calculation for longer videos
-        input_tokens = len(input_text.split())
+        input_tokens = self._token_count(input_text)
         input_cost = math.ceil(input_tokens * TWELVE_LABS_INPUT_TOKEN_COST)
 
         logger.info(f"Input tokens: {input_tokens}")
         logger.info(f"Input cost: {input_cost} millicents")
 
         try:
-            await self.authorize_cost(
-                request,
-                [
-                    fp.CostItem(
-                        amount_usd_milli_cents=input_cost,
-                        description="Text generation input"
-                    ),
-                    fp.CostItem(
-                        amount_usd_milli_cents=math.ceil(OUTPUT_TEXT_TOKEN_ASSUMPTION * TWELVE_LABS_OUTPUT_TOKEN_COST),
-                        description="Text generation output"
-                    )
-                ]
-            )
-            
-            output_tokens = len(output_text.split())
+            output_tokens = self._token_count(output_text)
             output_cost = math.ceil(output_tokens * TWELVE_LABS_OUTPUT_TOKEN_COST)
 
             logger.info(f"Output tokens: {output_tokens}")
@@ -1234,14 +1544,8 @@ class TwelveLabsBot(fp.PoeBot):
             logger.info(f"Total text generation cost: {input_cost + output_cost} millicents")
 
             costs = [
-                fp.CostItem(
-                    amount_usd_milli_cents=input_cost,
-                    description="Text generation input"
-                ),
-                fp.CostItem(
-                    amount_usd_milli_cents=output_cost,
-                    description="Text generation output"
-                )
+                _cost_item(input_cost, "Text generation input"),
+                _cost_item(output_cost, "Text generation output")
             ]
 
             await self.capture_cost(request, costs)
@@ -1257,48 +1561,190 @@ class TwelveLabsBot(fp.PoeBot):
     async def extract_video_segment(self, video_url, start_time, end_time):
         """
         Extracts a segment of video between start_time and end_time.
-        Returns the path to the extracted segment.
+        Returns the extracted segment as MP4 bytes.
         """
-        try:
-            start = time.time()
-            # Create a temporary file for the segment
-            with NamedTemporaryFile(suffix='.mp4', delete=False) as output_file:
-                ffmpeg_command = [
-                    'ffmpeg',
+        segment_data = await self.extract_video_segments(video_url, [(start_time, end_time)])
+        return segment_data[0]
+
+    async def extract_video_segments(self, video_url, segments):
+        """
+        Extracts several (start_time, end_time) segments of a video in a single ffmpeg process,
+        which pays the process startup and codec initialization once instead of per segment.
+        Segments of a local H.264 video that start near a keyframe are cut without re-encoding;
+        a remote video is read and decoded once for all segments.
+        Returns the extracted segments as MP4 bytes, or Nones if extraction failed.
+        """
+        if not segments:
+            return []
+        video_args = SEGMENT_ENCODER_ARGS[await self._h264_encoder()]
+        remote = video_url.startswith(('http://', 'https://'))
+        
+        # (start, end, stream copy) per segment
+        plans = [(start_time, end_time, False) for start_time, end_time in segments]
+        if not remote:
+            try:
+                codec, keyframes = await self._keyframe_info(video_url, [start for start, _ in segments])
+            except subprocess.CalledProcessError as e:
+                logger.warning(f"Failed to read keyframes, re-encoding segments: {e.stderr}")
+            else:
+                if codec == 'h264' and keyframes:
+                    plans = [
+                        self._snap_to_keyframe(start_time, end_time, keyframes)
+                        for start_time, end_time in segments
+                    ]
+        
+        start_ns = time.monotonic_ns()
+        outputs = await self._extract_segments(video_url, plans, video_args, shared_input=remote)
+        if outputs is None and any(copy for _, _, copy in plans):
+            logger.warning("Stream copy failed, re-encoding segments")
+            plans = [(start_time, end_time, False) for start_time, end_time in segments]
+            outputs = await self._extract_segments(video_url, plans, video_args)
+        if outputs is None:
+            return [None] * len(segments)
+        
+        duration = (time.monotonic_ns() - start_ns) / 1e9
+        copied = sum(copy for _, _, copy in plans)
+        logger.info(
+            f"{len(segments)} video segment(s) ({copied} stream-copied) extracted successfully in {duration:.2f} seconds"
+        )
+        return outputs
+
+    async def _extract_segments(self, video_url, plans, video_args, shared_input=False):
+        """
+        Run one ffmpeg for (start, end, stream copy) plans; returns each output's bytes, or None on failure.
+        With shared_input, the video is opened once and every output is cut from that single decode.
+        """
+        # Every output is written as fragmented MP4 to its own pipe and read while ffmpeg runs,
+        # instead of going to a tempfile that is read back once ffmpeg exits
+        pipes = [os.pipe() for _ in plans]
+        # -threads applies per decoder and encoder, so the run's budget is split across clips
+        threads = str(max(1, FFMPEG_THREADS // (2 * len(plans))))
+        ffmpeg_command = ['ffmpeg', *FFMPEG_QUIET_ARGS, '-y']
+        if shared_input:
+            # Over HTTP every input is its own connection and moov parse, so read the video
+            # once; ffmpeg stops reading as soon as the last segment has ended
+            ffmpeg_command += ['-threads', str(FFMPEG_THREADS // 2 or 1), '-i', video_url]
+        else:
+            # Each segment is its own seeked input, so every output keeps the fast input-side seek
+            for start_time, end_time, _ in plans:
+                ffmpeg_command += [
+                    '-threads', threads,
                     '-ss', str(start_time),  # Move -ss before -i for faster seeking
-                    '-i', video_url,
                     '-t', str(end_time - start_time),
-                    '-c:v', 'libx264',
-                    '-preset', 'ultrafast',  # Fastest encoding preset
-                    '-tune', 'fastdecode',   # Optimize for fast decoding
-                    '-profile:v', 'baseline', # Simpler profile for faster encoding
-                    '-level', '3.0',         # Compatible level for mobile/web
-                    '-movflags', '+faststart', # Optimize for web playback
-                    '-c:a', 'aac',
-                    '-b:a', '128k',          # Reasonable audio quality
-                    '-y',
-                    output_file.name
+                    '-i', video_url,
                 ]
-                
-                result = subprocess.run(
-                    ffmpeg_command,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                duration = time.time() - start
-                logger.info(f"Video segment extracted successfully in {duration:.2f} seconds")
-                return output_file.name
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to extract video segment: {e.stderr}")
+        for output_index, ((start_time, end_time, copy), (_, write_fd)) in enumerate(zip(plans, pipes)):
+            input_index = 0 if shared_input else output_index
+            if shared_input:
+                # Output-side cut from the shared decode
+                ffmpeg_command += ['-ss', str(start_time), '-t', str(end_time - start_time)]
+            ffmpeg_command += [
+                '-map', f'{input_index}:v:0',
+                '-map', f'{input_index}:a:0?',
+                *(['-c:v', 'copy', '-avoid_negative_ts', 'make_zero'] if copy else [*video_args, '-threads', threads]),
+                '-movflags', 'frag_keyframe+empty_moov+default_base_moof', # Playable without seeking back
+                '-c:a', 'aac',
+                '-b:a', '128k',          # Reasonable audio quality
+                '-f', 'mp4',
+                f'pipe:{write_fd}'
+            ]
+        
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *ffmpeg_command,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=[write_fd for _, write_fd in pipes]
+            )
+        except BaseException:
+            for read_fd, _ in pipes:
+                os.close(read_fd)
+            raise
+        finally:
+            # Only ffmpeg holds the write ends now, so the readers see EOF when it exits
+            for _, write_fd in pipes:
+                os.close(write_fd)
+        
+        try:
+            *outputs, stderr = await asyncio.gather(
+                *(self._read_pipe(read_fd) for read_fd, _ in pipes),
+                self._stderr_tail(process.stderr)
+            )
+            await process.wait()
+        except asyncio.CancelledError:
+            # Don't leave ffmpeg running when the request that started it goes away
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode:
+            logger.error(f"Failed to extract video segments: {stderr}")
             return None
+        return outputs
+
+    @staticmethod
+    async def _read_pipe(read_fd):
+        """Read a pipe to EOF on the event loop, closing it"""
+        # Every pipe is drained concurrently no matter how many outputs there are; ffmpeg
+        # interleaves its outputs, so one unread pipe would block it and every other reader
+        pipe = open(read_fd, 'rb', buffering=0)
+        reader = asyncio.StreamReader(limit=PIPE_READ_SIZE)
+        try:
+            transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), pipe
+            )
+        except BaseException:
+            pipe.close()
+            raise
+        try:
+            return await reader.read()
+        finally:
+            transport.close()
+
+    async def _keyframe_info(self, path, start_times):
+        """
+        Return (video codec, sorted keyframe times) of a local video. Only the packets in the
+        KEYFRAME_SNAP_TOLERANCE window before each start time are read, without decoding.
+        """
+        # Each interval seeks to the keyframe at or before its start, so the keyframe a clip
+        # would snap to is always listed; the end is nudged to include one exactly at the start
+        intervals = ','.join(
+            f'{max(start_time - KEYFRAME_SNAP_TOLERANCE, 0)}%{start_time + 0.001}'
+            for start_time in sorted(start_times)
+        )
+        probe_command = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-read_intervals', intervals,
+            '-show_entries', 'stream=codec_name:packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            path
+        ]
+        codec = None
+        keyframes = set()  # Overlapping intervals list the same packets
+        for line in (await self._run(probe_command)).splitlines():
+            if ',' not in line:
+                codec = line.strip() or codec
+                continue
+            pts_time, flags = line.split(',', 1)
+            if 'K' in flags and pts_time != 'N/A':
+                keyframes.add(float(pts_time))
+        return codec, sorted(keyframes)
+
+    @staticmethod
+    def _snap_to_keyframe(start_time, end_time, keyframes):
+        """Move a segment start back to the previous keyframe if it is close enough to stream-copy"""
+        index = bisect.bisect_right(keyframes, start_time) - 1
+        if index >= 0 and start_time - keyframes[index] <= KEYFRAME_SNAP_TOLERANCE:
+            return keyframes[index], end_time, True
+        return start_time, end_time, False
 
 # Create shared volume for persistent storage
 storage_vol = Volume.from_name("twelve-labs-storage", create_if_missing=True)
 
 
 #deploy the app
-REQUIREMENTS = ["fastapi-poe==0.0.53","twelvelabs==0.4.3"]
+REQUIREMENTS = ["fastapi-poe==0.0.53","twelvelabs==0.4.3","msgspec","xxhash"]
 image = (
     Image.debian_slim()
     .apt_install([
@@ -3,68 +3,85 @@
 Multipart Asset Upload Script
 
 This script handles the complete multipart upload flow:
-1. Splits file into chunks
-2. Creates upload session 
-3. Uploads chunks to S3
+1. Creates upload session 
+2. Splits file into chunk byte ranges
+3. Uploads chunks to S3 straight from the source file
 4. Reports completed chunks
 5. Monitors progress until completion
 
+Progress is checkpointed to ~/.twelvelabs/multipart_state, so rerunning the same
+command after a crash resumes the upload instead of starting over.
+
 Usage:
     python multipart_upload.py --file video.mp4 --api-key tlk_xxx --filename "my-video.mp4"
 """
 
 import argparse
+import base64
+import hashlib
 import json
+import logging
+import math
 import os
+import queue
+import socket
 import sys
+import threading
 import time
 from typing import List, Dict, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 from pathlib import Path
 
+UPLOAD_WORKERS = 16  # default concurrent chunk uploads for the whole file
+URLS_PER_PAGE = 10  # presigned URLs returned per get_additional_urls page
+REPORT_INTERVAL = 2  # max seconds completed chunks wait before being reported
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024  # cap on chunk bytes held in memory (soft above 1/3 of it per chunk)
+READ_AHEAD_CHUNKS = 4  # max chunks read and hashed ahead of the upload threads
+S3_SNDBUF = 4 * 1024 * 1024  # socket send buffer for S3 PUT connections
+PROGRESS_INTERVAL = 5  # seconds between aggregate progress lines
+STATE_DIR = Path.home() / '.twelvelabs' / 'multipart_state'  # resume checkpoints, one JSON file per upload
+
+logger = logging.getLogger(__name__)
+
+
+class S3Adapter(HTTPAdapter):
+    """HTTPAdapter whose connections have a large send buffer, so one PUT can fill a fast or high-RTT link"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        # Keep urllib3's defaults (TCP_NODELAY) and add the larger buffer; the kernel caps it
+        # at net.core.wmem_max
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, S3_SNDBUF)
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
 
 class MultipartUploadClient:
-    def __init__(self, base_url: str = "https://api.twelvelabs.io/v1.3", api_key: str = None):
+    def __init__(self, base_url: str = "https://api.twelvelabs.io/v1.3", api_key: str = None,
+                 max_workers: int = UPLOAD_WORKERS):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
+        self.max_workers = max_workers
+        self._read_lock = threading.Lock()  # Serializes seek+read where os.pread is unavailable
         self.session = requests.Session()
         
         if api_key:
             self.session.headers.update({
                 'x-api-key': api_key
             })
-
-    def split_file(self, file_path: str, chunk_size: int) -> List[str]:
-        """Split file into chunks and return list of chunk file paths"""
-        file_path = Path(file_path)
-        if not file_path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
-        
-        file_size = file_path.stat().st_size
-        print(f"📁 Splitting {file_path.name} ({file_size:,} bytes) into {chunk_size:,} byte chunks...")
-        
-        chunk_files = []
-        chunk_dir = file_path.parent / f"{file_path.stem}_chunks"
-        chunk_dir.mkdir(exist_ok=True)
-        
-        with open(file_path, 'rb') as f:
-            chunk_num = 1
-            while True:
-                chunk_data = f.read(chunk_size)
-                if not chunk_data:
-                    break
-                    
-                chunk_file = chunk_dir / f"chunk_{chunk_num:04d}"
-                with open(chunk_file, 'wb') as chunk_f:
-                    chunk_f.write(chunk_data)
-                
-                chunk_files.append(str(chunk_file))
-                print(f"  📄 Created chunk {chunk_num}: {len(chunk_data):,} bytes")
-                chunk_num += 1
         
-        print(f"✅ Split into {len(chunk_files)} chunks")
-        return chunk_files, file_size
+        # Separate session for presigned S3 PUTs (no API key), with a connection pool large
+        # enough for every upload thread so keep-alive connections are reused across chunks
+        self.s3_session = requests.Session()
+        self.s3_session.mount('https://', S3Adapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+        ))
 
     def create_upload_session(self, filename: str, file_type: str, total_size: int) -> Dict:
         """Create multipart upload session"""
@@ -90,31 +107,94 @@ class MultipartUploadClient:
         
         return result
 
-    def upload_chunk_to_s3(self, chunk_file: str, presigned_url: str) -> str:
-        """Upload a single chunk to S3 and return ETag"""
-        chunk_name = Path(chunk_file).name
-        chunk_size = Path(chunk_file).stat().st_size
-        
-        print(f"📤 Uploading {chunk_name} ({chunk_size:,} bytes)...")
-        
-        with open(chunk_file, 'rb') as f:
-            response = requests.put(
-                presigned_url,
-                data=f,
-                headers={'Content-Type': 'application/octet-stream'}
-            )
+    def _read_range(self, fd: int, start: int, length: int) -> bytes:
+        """Read length bytes at offset start from a file descriptor"""
+        parts = []
+        while length:
+            if hasattr(os, 'pread'):
+                # Positional read: one syscall, no shared file offset to lock
+                data = os.pread(fd, length, start)
+            else:
+                with self._read_lock:
+                    os.lseek(fd, start, os.SEEK_SET)
+                    data = os.read(fd, length)
+            if not data:
+                raise EOFError(f"Unexpected end of file at byte {start}")
+            parts.append(data)
+            start += len(data)
+            length -= len(data)
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def upload_chunk_to_s3(self, chunk_index: int, data: bytes, md5: bytes, presigned_url: str) -> str:
+        """Upload one chunk to S3 and return ETag; S3 rejects the PUT if the body doesn't match md5"""
+        chunk_name = f"chunk_{chunk_index:04d}"
+        
+        logger.debug("📤 Uploading %s (%s bytes)...", chunk_name, f"{len(data):,}")
+        
+        # Bytes with a known length are sent with a Content-Length header, which presigned
+        # S3 PUTs require
+        response = self.s3_session.put(
+            presigned_url,
+            data=data,
+            headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-MD5': base64.b64encode(md5).decode()
+            }
+        )
         
         response.raise_for_status()
         
         # Extract ETag (remove quotes if present)
         etag = response.headers.get('ETag', '').strip('"')
-        print(f"✅ {chunk_name} uploaded, ETag: {etag}")
+        logger.debug("✅ %s uploaded, ETag: %s", chunk_name, etag)
         
         return etag
 
+    def _read_chunks(self, fd: int, chunk_ranges: List[Tuple[int, int]], chunk_indexes: List[int],
+                     chunks: queue.Queue, stop: threading.Event):
+        """Producer: read and hash chunks in file order into the bounded queue the upload threads consume"""
+        try:
+            for chunk_index in chunk_indexes:
+                start, length = chunk_ranges[chunk_index - 1]
+                data = self._read_range(fd, start, length)
+                if not self._put_chunk(chunks, stop, (chunk_index, data, hashlib.md5(data).digest())):
+                    return
+        except Exception as e:
+            # Hand the error to the upload threads instead of leaving them waiting
+            self._put_chunk(chunks, stop, (None, e, None))
+
+    @staticmethod
+    def _put_chunk(chunks: queue.Queue, stop: threading.Event, item: Tuple) -> bool:
+        """Put an item on the chunk queue unless the upload is stopped; returns False if it was"""
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=REPORT_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _upload_next_chunk(self, chunks: queue.Queue, stop: threading.Event,
+                           urls: Dict[int, str]) -> Tuple[int, int, str, str]:
+        """Consumer: upload the next read chunk and return (chunk_index, length, ETag, MD5)"""
+        while True:
+            if stop.is_set():
+                raise Exception("Upload stopped")
+            try:
+                chunk_index, data, md5 = chunks.get(timeout=REPORT_INTERVAL)
+                break
+            except queue.Empty:
+                pass
+        if chunk_index is None:
+            # Reader failed; pass the error on to the next upload thread as well
+            chunks.put((None, data, None))
+            raise data
+        etag = self.upload_chunk_to_s3(chunk_index, data, md5, urls[chunk_index])
+        return chunk_index, len(data), etag, md5.hex()
+
     def get_additional_urls(self, upload_id: str, page: int = 1, limit: int = 10) -> List[Dict]:
         """Get additional presigned URLs if needed"""
-        print(f"🔗 Getting additional URLs for upload {upload_id}...")
+        logger.debug("🔗 Getting additional URLs for upload %s (page %d)...", upload_id, page)
         
         url = f"{self.base_url}/assets/multipart-uploads/{upload_id}/presigned-urls"
         data = {'page': page, 'limit': limit}
@@ -124,13 +204,13 @@ class MultipartUploadClient:
         
         result = response.json()
         urls = result.get('upload_urls', [])
-        print(f"✅ Got {len(urls)} additional URLs")
+        logger.debug("✅ Got %d additional URLs", len(urls))
         
         return urls
 
     def report_completed_chunks(self, upload_id: str, completed_chunks: List[Dict]) -> Dict:
         """Report completed chunks to the backend"""
-        print(f"📋 Reporting {len(completed_chunks)} completed chunks...")
+        logger.debug("📋 Reporting %d completed chunks...", len(completed_chunks))
         
         url = f"{self.base_url}/assets/multipart-uploads/{upload_id}"
         data = {"completed_chunks": completed_chunks}
@@ -139,10 +219,8 @@ class MultipartUploadClient:
         response.raise_for_status()
         
         result = response.json()
-        print(f"✅ Reported chunks:")
-        print(f"   Processed: {result['processed_chunks']}")
-        print(f"   Duplicates: {result['duplicate_chunks']}")
-        print(f"   Total completed: {result['total_completed']}")
+        logger.debug("✅ Reported chunks: processed %s, duplicates %s, total completed %s",
+                     result['processed_chunks'], result['duplicate_chunks'], result['total_completed'])
         
         if result.get('url'):
             print(f"🎉 Upload complete! Asset URL: {result['url'][:100]}...")
@@ -159,27 +237,52 @@ class MultipartUploadClient:
         
         return response.json()
 
-    def cleanup_chunks(self, chunk_files: List[str]):
-        """Clean up temporary chunk files"""
-        print("🧹 Cleaning up chunk files...")
-        for chunk_file in chunk_files:
+    def _find_state(self, file_path: Path, file_stat: os.stat_result) -> Optional[Dict]:
+        """Return the checkpoint of an unfinished upload of this unchanged file, if any"""
+        for state_path in STATE_DIR.glob('*.json'):
             try:
-                os.remove(chunk_file)
-            except OSError:
-                pass
-        
-        # Remove chunk directory if empty
-        if chunk_files:
-            chunk_dir = Path(chunk_files[0]).parent
-            try:
-                chunk_dir.rmdir()
-            except OSError:
-                pass
-        
-        print("✅ Cleanup complete")
+                state = json.loads(state_path.read_text())
+            except (OSError, ValueError):
+                continue
+            if (state.get('file') == str(file_path.resolve()) and state.get('size') == file_stat.st_size
+                    and state.get('mtime_ns') == file_stat.st_mtime_ns):
+                return state
+        return None
+
+    def _save_state(self, state: Dict):
+        """Atomically write an upload checkpoint"""
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        state_path = STATE_DIR / f"{state['upload_id']}.json"
+        temp_path = state_path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(state))
+        os.replace(temp_path, state_path)
+
+    def _remove_state(self, upload_id: str):
+        """Delete the checkpoint of a finished or abandoned upload"""
+        try:
+            (STATE_DIR / f"{upload_id}.json").unlink()
+        except FileNotFoundError:
+            pass
+
+    def _verify_chunks(self, file_path: Path, chunk_ranges: List[Tuple[int, int]],
+                       chunks: Dict[str, Dict]) -> List[Dict]:
+        """Return report entries for checkpointed chunks whose bytes on disk still match their MD5"""
+        verified = []
+        with open(file_path, 'rb') as f:
+            for chunk_index, chunk in sorted(chunks.items(), key=lambda item: int(item[0])):
+                start, length = chunk_ranges[int(chunk_index) - 1]
+                f.seek(start)
+                if hashlib.md5(f.read(length)).hexdigest() == chunk['md5']:
+                    verified.append({
+                        "chunk_index": int(chunk_index),
+                        "proof": chunk['proof'],
+                        "proof_type": "etag",
+                        "chunk_size": length
+                    })
+        return verified
 
     def upload_file(self, file_path: str, filename: str = None, file_type: str = "video", 
-                   batch_size: int = 10) -> str:
+                   batch_size: int = 10, resume: bool = True) -> str:
         """
         Complete multipart upload flow
         
@@ -188,6 +291,7 @@ class MultipartUploadClient:
             filename: Name to use for the asset (defaults to file basename)
             file_type: Asset type (default: "video")
             batch_size: Number of chunks to report in each batch (default: 4)
+            resume: Continue a checkpointed upload of the same file (default: True)
             
         Returns:
             Final asset URL
@@ -196,107 +300,219 @@ class MultipartUploadClient:
         if filename is None:
             filename = file_path.name
             
+        # Step 1: Get file size first; a single stat() also checks the file exists
         try:
-            # Step 1: Get file size first
-            total_size = file_path.stat().st_size
-            print(f"📁 File size: {total_size:,} bytes")
-            
-            # Step 2: Create upload session
+            file_stat = file_path.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        total_size = file_stat.st_size
+        print(f"📁 File size: {total_size:,} bytes")
+        
+        # Step 2: Resume the checkpointed session of this file if the backend still has it,
+        # otherwise create a new upload session
+        state = self._find_state(file_path, file_stat) if resume else None
+        if state:
+            try:
+                status = self.get_upload_status(state['upload_id'])
+            except requests.HTTPError as e:
+                print(f"⚠️  Can't resume upload {state['upload_id']} ({e}), starting over")
+                self._remove_state(state['upload_id'])
+                state = None
+            else:
+                if status['status'] == 'completed':
+                    self._remove_state(state['upload_id'])
+                    return self.get_asset_url(state['asset_id'])
+        
+        if state:
+            print(f"🔁 Resuming upload {state['upload_id']} ({len(state['chunks'])} chunks checkpointed)")
+            upload_session = {'upload_id': state['upload_id'], 'asset_id': state['asset_id'],
+                              'chunk_size': state['chunk_size'], 'upload_urls': []}
+        else:
             upload_session = self.create_upload_session(filename, file_type, total_size)
-            upload_id = upload_session['upload_id']
-            chunk_size = upload_session['chunk_size']
+            state = {
+                'upload_id': upload_session['upload_id'],
+                'asset_id': upload_session['asset_id'],
+                'chunk_size': upload_session['chunk_size'],
+                'file': str(file_path.resolve()),
+                'size': total_size,
+                'mtime_ns': file_stat.st_mtime_ns,
+                'chunks': {}
+            }
+            self._save_state(state)
+        upload_id = upload_session['upload_id']
+        chunk_size = upload_session['chunk_size']
 
-            # Step 3: Split file using chunk size from upload session
-            chunk_files, _ = self.split_file(str(file_path), chunk_size)
-            
-            # Step 3: Upload all chunks in parallel batches
-            current_urls = {url['chunk_index']: url['url'] for url in upload_session['upload_urls']}
-            print(f"🔗 Initial URLs available: {len(current_urls)}")
-            
-            # Process chunks in batches with parallel uploads
-            total_chunks = len(chunk_files)
-            for batch_start in range(0, total_chunks, batch_size):
-                batch_end = min(batch_start + batch_size, total_chunks)
-                batch_chunk_files = chunk_files[batch_start:batch_end]
-                batch_indices = list(range(batch_start + 1, batch_end + 1))  # 1-based indexing
-                
-                print(f"📦 Processing batch: chunks {batch_indices[0]}-{batch_indices[-1]} ({len(batch_chunk_files)} chunks)")
-                
-                # Ensure we have URLs for all chunks in this batch
-                missing_urls = [idx for idx in batch_indices if idx not in current_urls]
-                if missing_urls:
-                    print(f"🔗 Need URLs for chunks: {missing_urls}")
-                    # Get additional URLs for missing chunks
-                    for chunk_index in missing_urls:
-                        page = (chunk_index - 1) // 10 + 1
-                        additional_urls = self.get_additional_urls(upload_id, page=page)
-                        for url_info in additional_urls:
-                            current_urls[url_info['chunk_index']] = url_info['url']
+        # Step 3: Split file into byte ranges using chunk size from upload session.
+        # Chunks are read from the source file at upload time, no chunk files are written
+        total_chunks = math.ceil(total_size / chunk_size)
+        chunk_ranges = [
+            (i * chunk_size, min(chunk_size, total_size - i * chunk_size))
+            for i in range(total_chunks)
+        ]
+        print(f"✅ Split into {total_chunks} chunks of up to {chunk_size:,} bytes")
+        
+        # Checkpointed chunks are only skipped if the bytes on disk still hash the same; they
+        # are reported again since the crash may have happened before their report went out
+        resumed_chunks = self._verify_chunks(file_path, chunk_ranges, state['chunks']) if state['chunks'] else []
+        resumed_indexes = {chunk['chunk_index'] for chunk in resumed_chunks}
+        chunk_indexes = [idx for idx in range(1, total_chunks + 1) if idx not in resumed_indexes]  # 1-based indexing
+        if resumed_chunks:
+            print(f"⏭️  Skipping {len(resumed_chunks)} already uploaded chunks")
+        
+        # The server picks the chunk size, so size the concurrency to it instead: small chunks
+        # get all workers to fill the link, large ones fewer so memory stays bounded. Chunks in
+        # memory are the uploading ones, the read-ahead queue and the one being read; the floor
+        # of one each means chunks over a third of MAX_IN_FLIGHT_BYTES exceed the cap
+        chunk_budget = MAX_IN_FLIGHT_BYTES // chunk_size
+        read_ahead = max(1, min(READ_AHEAD_CHUNKS, chunk_budget // 4))
+        workers = max(1, min(self.max_workers, len(chunk_indexes), chunk_budget - read_ahead - 1))
+        if workers < self.max_workers:
+            print(f"🧵 Using {workers} upload workers for {chunk_size:,} byte chunks")
+        
+        # Step 4: Make sure every chunk has a presigned URL, fetching each missing page once
+        current_urls = {url['chunk_index']: url['url'] for url in upload_session['upload_urls']}
+        print(f"🔗 Initial URLs available: {len(current_urls)}")
+        
+        missing_urls = [idx for idx in chunk_indexes if idx not in current_urls]
+        if missing_urls:
+            print(f"🔗 Need URLs for {len(missing_urls)} chunks")
+            pages = sorted({(idx - 1) // URLS_PER_PAGE + 1 for idx in missing_urls})
+            # Fetch all missing pages concurrently before any upload starts
+            with ThreadPoolExecutor(max_workers=min(len(pages), self.max_workers)) as executor:
+                for additional_urls in executor.map(
+                    lambda page: self.get_additional_urls(upload_id, page=page, limit=URLS_PER_PAGE), pages
+                ):
+                    for url_info in additional_urls:
+                        current_urls[url_info['chunk_index']] = url_info['url']
+        
+        # Verify all URLs are available
+        for chunk_index in chunk_indexes:
+            if chunk_index not in current_urls:
+                raise Exception(f"No presigned URL available for chunk {chunk_index}")
+        
+        # Step 5: Upload all chunks on one thread pool. A single reader thread reads and hashes
+        # chunks in file order a few ahead of the upload threads, so PUTs never wait on disk.
+        # Completed chunks are reported from a background reporter thread, so uploads keep
+        # flowing while a report is in flight
+        uploaded = len(resumed_chunks)
+        uploaded_bytes = 0
+        upload_bytes = sum(chunk_ranges[idx - 1][1] for idx in chunk_indexes)
+        pending_report = []
+        reports = []
+        last_report = last_progress = time.monotonic()
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        if hasattr(os, 'posix_fadvise'):
+            # Chunks are read in order, so let the kernel read ahead aggressively
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        chunks = queue.Queue(maxsize=read_ahead)
+        stop = threading.Event()
+        reader = threading.Thread(
+            target=self._read_chunks, args=(fd, chunk_ranges, chunk_indexes, chunks, stop), daemon=True
+        )
+        reader.start()
+        try:
+            upload_start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=workers) as executor, \
+                    ThreadPoolExecutor(max_workers=1) as reporter:
+                for i in range(0, len(resumed_chunks), batch_size):
+                    reports.append(reporter.submit(
+                        self.report_completed_chunks, upload_id, resumed_chunks[i:i + batch_size]
+                    ))
                 
-                # Verify all URLs are available
-                for chunk_index in batch_indices:
-                    if chunk_index not in current_urls:
-                        raise Exception(f"No presigned URL available for chunk {chunk_index}")
+                # One upload task per chunk; each takes whichever chunk the reader produces next
+                not_done = {
+                    executor.submit(self._upload_next_chunk, chunks, stop, current_urls)
+                    for _ in chunk_indexes
+                }
                 
-                # Upload batch chunks in parallel
-                completed_chunks = []
-                max_workers = min(len(batch_chunk_files), 5)  # Limit concurrent uploads
+                def record(chunk_index, length, etag, md5):
+                    nonlocal uploaded, uploaded_bytes
+                    state['chunks'][str(chunk_index)] = {'md5': md5, 'proof': etag}
+                    pending_report.append({
+                        "chunk_index": chunk_index,
+                        "proof": etag,
+                        "proof_type": "etag", 
+                        "chunk_size": length
+                    })
+                    uploaded += 1
+                    uploaded_bytes += length
+                    logger.debug("✅ Chunk %d completed", chunk_index)
                 
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    # Submit all uploads in the batch
-                    future_to_chunk = {}
-                    for i, chunk_file in enumerate(batch_chunk_files):
-                        chunk_index = batch_indices[i]
-                        presigned_url = current_urls[chunk_index]
-                        future = executor.submit(self.upload_chunk_to_s3, chunk_file, presigned_url)
-                        future_to_chunk[future] = (chunk_index, chunk_file)
-                    
-                    # Collect results as they complete
-                    for future in as_completed(future_to_chunk):
-                        chunk_index, chunk_file = future_to_chunk[future]
+                # Collect results as they complete, waking up at least every REPORT_INTERVAL
+                try:
+                    while not_done:
+                        done, not_done = wait(not_done, timeout=REPORT_INTERVAL, return_when=FIRST_COMPLETED)
                         try:
-                            etag = future.result()
-                            chunk_size_bytes = Path(chunk_file).stat().st_size
-                            completed_chunks.append({
-                                "chunk_index": chunk_index,
-                                "proof": etag,
-                                "proof_type": "etag", 
-                                "chunk_size": chunk_size_bytes
-                            })
-                            print(f"✅ Chunk {chunk_index} completed in batch")
-                        except Exception as e:
-                            print(f"❌ Chunk {chunk_index} failed: {e}")
-                            raise
-                
-                # Report completed batch
-                print(f"📋 Reporting batch of {len(completed_chunks)} chunks...")
-                result = self.report_completed_chunks(upload_id, completed_chunks)
-                
-                # Check if upload is complete
-                if result.get('url'):
-                    print(f"🎉 Upload completed successfully!")
-                    return result['url']
+                            for future in done:
+                                record(*future.result())
+                        finally:
+                            if done:
+                                self._save_state(state)
+                        
+                        # Report a batch once it is full, REPORT_INTERVAL has passed or the last chunk is done
+                        if pending_report and (len(pending_report) >= batch_size or not not_done
+                                               or time.monotonic() - last_report >= REPORT_INTERVAL):
+                            reports.append(reporter.submit(self.report_completed_chunks, upload_id, pending_report))
+                            pending_report = []
+                            last_report = time.monotonic()
+                        
+                        # One aggregate progress line every PROGRESS_INTERVAL instead of lines per chunk
+                        now = time.monotonic()
+                        if now - last_progress >= PROGRESS_INTERVAL or not not_done:
+                            last_progress = now
+                            rate = uploaded_bytes / max(now - upload_start, 1e-6)
+                            eta = (upload_bytes - uploaded_bytes) / rate if rate else 0
+                            print(f"📊 Progress: {uploaded}/{total_chunks} chunks, "
+                                  f"{rate / 1024 / 1024:.1f} MiB/s, ETA {eta:.0f}s")
+                        
+                        # Surface report errors as soon as they happen
+                        for report in [report for report in reports if report.done()]:
+                            report.result()
+                except BaseException as e:
+                    # A failed chunk or report, or Ctrl-C: stop the reader and drop queued uploads and
+                    # reports here, otherwise leaving the executors would PUT the rest of the file first
+                    print(f"❌ Upload failed: {e!r}")
+                    stop.set()
+                    for pending in [*not_done, *reports]:
+                        pending.cancel()
+                    # Checkpoint the uploads that were already running, so a resume skips them
+                    for future in wait(not_done).done:
+                        if not future.cancelled() and future.exception() is None:
+                            record(*future.result())
+                    self._save_state(state)
+                    raise
                 
-                print(f"📊 Progress: {batch_end}/{total_chunks} chunks uploaded")
-            
-            # Final status check
-            print("⏳ Checking final status...")
-            status = self.get_upload_status(upload_id)
-            print(f"📊 Final status: {status['status']}")
-            print(f"   Completed: {status['chunks_completed']}/{status['total_chunks']}")
-            
-            if status['status'] == 'completed':
-                # Get the asset URL by checking the asset endpoint
-                asset_id = upload_session['asset_id']
-                asset_url = self.get_asset_url(asset_id)
-                return asset_url
-            else:
-                raise Exception(f"Upload not completed. Status: {status['status']}")
+                elapsed = time.monotonic() - upload_start
+                print(f"📈 Uploaded {upload_bytes:,} bytes in {elapsed:.1f}s "
+                      f"({upload_bytes / max(elapsed, 1e-6) / 1024 / 1024:.1f} MiB/s)")
                 
+                # Wait for the reports still in flight; the last one completes the upload
+                for report in reports:
+                    result = report.result()
+                    if result.get('url'):
+                        print(f"🎉 Upload completed successfully!")
+                        self._remove_state(upload_id)
+                        return result['url']
         finally:
-            # Cleanup temporary files
-            if 'chunk_files' in locals():
-                self.cleanup_chunks(chunk_files)
+            # The reader must be done with the descriptor before it is closed
+            stop.set()
+            reader.join()
+            os.close(fd)
+        
+        # Final status check
+        print("⏳ Checking final status...")
+        status = self.get_upload_status(upload_id)
+        print(f"📊 Final status: {status['status']}")
+        print(f"   Completed: {status['chunks_completed']}/{status['total_chunks']}")
+        
+        if status['status'] == 'completed':
+            self._remove_state(upload_id)
+            # Get the asset URL by checking the asset endpoint
+            asset_id = upload_session['asset_id']
+            asset_url = self.get_asset_url(asset_id)
+            return asset_url
+        else:
+            raise Exception(f"Upload not completed. Status: {status['status']}")
 
     def get_asset_url(self, asset_id: str) -> str:
         """Get the final asset URL"""
@@ -316,15 +532,25 @@ def main():
     parser.add_argument('--type', default='video', help='Asset type (default: video)')
     parser.add_argument('--base-url', default='https://api.twelvelabs.io/v1.3', help='Base URL of the API')
     parser.add_argument('--batch-size', type=int, default=10, help='Chunks to report per batch (default: 4)')
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS,
+                        help=f'Concurrent chunk uploads (default: {UPLOAD_WORKERS})')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Start a new upload even if this file has a checkpointed one')
+    parser.add_argument('--verbose', action='store_true', help='Log every chunk upload and report')
     
     args = parser.parse_args()
+    logging.basicConfig(format='%(message)s')
+    if args.verbose:
+        # Only this script's per-chunk lines, not every urllib3 connection
+        logger.setLevel(logging.DEBUG)
     
     try:
-        client = MultipartUploadClient(args.base_url, args.api_key)
+        client = MultipartUploadClient(args.base_url, args.api_key, args.workers)
         
         print("🚀 Starting multipart upload...")
         print(f"   File: {args.file}")
         print(f"   Batch size: {args.batch_size}")
+        print(f"   Workers: {args.workers}")
         print()
         
         start_time = time.time()
@@ -332,7 +558,8 @@ def main():
             args.file, 
             args.filename, 
             args.type,
-            args.batch_size
+            args.batch_size,
+            resume=not args.no_resume
         )
         end_time = time.time()
         